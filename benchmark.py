@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import tracemalloc
+import platform
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import yaml
+
+from factorySim.factorySimClass import FactorySim
+from factorySim.factorySimEnv import FactorySimEnv
+from factorySim.profiling import Profiler
+from factorySim.rendering import draw_BG, drawFactory, draw_obs_layer_A, draw_obs_layer_B
+import factorySim.baseConfigs as baseConfigs
+
+#Spans every case reports in the overview table, all other spans are only written to the json file
+OVERVIEW_SPANS = ["evaluate/Paths", "evaluate/Routes", "evaluate/KPIs", "evaluate", "env/observation", "env/step"]
+CONFIGS = ["SMALLSQUARE", "SMALL", "BIG", "EDF", "WIMMELBILD"]
+SCALING_STAGES = ["paths", "routes", "collisions", "mfIntersection", "evaluate", "render"]
+
+basePath = os.path.dirname(os.path.realpath(__file__))
+
+parser = argparse.ArgumentParser(description="Measures path finding, KPIs, evaluation, observations and env steps on fixed layouts.")
+parser.add_argument("--layouts", type=str, default=os.path.join(basePath, "Evaluation", "*.ifc"), help="Glob of ifc files, each is loaded with its _mf.csv. Empty string skips the ifc layouts.")
+parser.add_argument("--factoryconfig", type=str, default="SMALLSQUARE", help="Path parameters used for the ifc layouts.")
+parser.add_argument("--configs", type=str, nargs="*", default=CONFIGS, help="baseConfigs to benchmark with randomly created machines.")
+parser.add_argument("--poses", type=int, default=20, help="Number of seeded random layouts evaluated per case.")
+parser.add_argument("--steps", type=int, default=50, help="Number of seeded random env steps per case. 0 skips the env.")
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--output", type=str, default=None, help="Result file. Defaults to Output/benchmark_<timestamp>.json")
+parser.add_argument("--trace", action="store_true", help="Additionally write a Chrome trace per case next to the result file.")
+parser.add_argument("--compare", type=str, default=None, help="Earlier result file to compare against.")
+parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown of a mean span time that counts as regression in --compare.")
+parser.add_argument("--scaling", type=int, nargs="*", default=None, help="Instead of the layouts, benchmark synthetic factories with these numbers of machines, e.g. --scaling 10 30 100 300 1000")
+parser.add_argument("--repeat", type=int, default=3, help="Repetitions per stage in --scaling mode, the median time is reported.")
+
+
+def envConfig(inputfile, factoryconfig, createMachines, seed):
+    with open(os.path.join(basePath, "config.yaml"), 'r') as f:
+        f_config = yaml.load(f, Loader=yaml.FullLoader)
+    env_config = f_config['env_config']
+    env_config['inputfile'] = inputfile
+    env_config['factoryconfig'] = factoryconfig
+    env_config['createMachines'] = createMachines
+    env_config['randomSeed'] = seed
+    env_config['evaluation'] = False
+    env_config['render_mode'] = None
+    env_config['Loglevel'] = 0
+    env_config['profile'] = True
+    return env_config
+
+
+def benchmarkCase(name, ifcpath, materialflowpath, factoryconfig, args):
+    """Evaluates seeded random poses on one factory and steps an environment on the same input.
+
+    Returns:
+        dict: description of the case, throughput and the profiler summary of all spans
+    """
+    rng = np.random.default_rng(args.seed)
+    createMachines = ifcpath is None
+    result = {"name": name, "layout": ifcpath, "factoryconfig": factoryconfig}
+
+    profiler = Profiler(enabled=True)
+    factory = FactorySim(ifcpath,
+        path_to_materialflow_file = materialflowpath,
+        factoryConfig=baseConfigs.BaseFactoryConf.byStringName(factoryconfig),
+        randomPos=False,
+        createMachines=createMachines,
+        randSeed=args.seed,
+        verboseOutput=0,
+        profiler=profiler)
+    result["machines"] = len(factory.machine_dict)
+    result["walls"] = len(factory.wall_dict)
+    result["materialflows"] = len(factory.dfMF.index)
+
+    if args.poses > 0:
+        poses = rng.uniform(-1, 1, size=(args.poses, len(factory.machine_dict), 3))
+        start = time.perf_counter()
+        rewards, ratings = factory.evaluate_batch(poses)
+        result["evaluate_per_s"] = args.poses / (time.perf_counter() - start)
+        result["reward_mean"] = float(np.nanmean(rewards))
+        result["evaluate_failed"] = int(ratings["failed"].sum())
+
+    if args.steps > 0:
+        env = FactorySimEnv(env_config=envConfig(ifcpath or "", factoryconfig, createMachines, args.seed))
+        env.profiler = profiler
+        #Outside of evaluation mode the env does not look for the materialflow next to the ifc file
+        env.materialflowpath = materialflowpath
+        env.reset()
+        actions = rng.uniform(-1, 1, size=(args.steps, 3))
+        start = time.perf_counter()
+        for action in actions:
+            env.step(action)
+        result["env_steps_per_s"] = args.steps / (time.perf_counter() - start)
+
+    result["spans"] = profiler.summary()
+    if args.trace:
+        profiler.exportChromeTrace(os.path.splitext(args.output)[0] + f"_{name}.trace.json")
+    return result
+
+
+def scaledFactory(amountMachines, seed):
+    """FactorySim with a synthetic layout from FactoryCreator.create_scaled_factory and a random materialflow of about 1.1 flows per machine"""
+    factory = FactorySim(None,
+        factoryConfig=baseConfigs.SMALLSQUARE,
+        randomPos=False,
+        createMachines=True,
+        randSeed=seed,
+        verboseOutput=0)
+    factory.machine_dict, factory.wall_dict = factory.creator.create_scaled_factory(amountMachines)
+    factory.FACTORYDIMENSIONS = (factory.creator.factoryWidth, factory.creator.factoryHeight)
+    factory.DRAWINGORIGIN = (0, 0)
+    factory.dfMF = factory.creator.cleanMaterialFLow(factory.creator.createRandomMaterialFlow())
+    return factory
+
+
+def maxRSS():
+    #Peak resident memory of the process in MB, includes memory allocated by GEOS that tracemalloc does not see
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def scalingCase(amountMachines, args):
+    """Times every stage on a synthetic factory and measures the peak of python allocations per stage
+
+    Returns:
+        dict: sizes of the factory, median time in ms and tracemalloc peak in MB per stage
+    """
+    factory = scaledFactory(amountMachines, args.seed)
+    surface, ctx = factory.provideCairoDrawingData(500, 500)
+
+    def render():
+        draw_BG(ctx, factory.DRAWINGORIGIN, *factory.FACTORYDIMENSIONS, darkmode=False)
+        drawFactory(ctx, factory, drawColors=True, darkmode=False, drawNames=True)
+        draw_obs_layer_A(ctx, factory)
+        draw_obs_layer_B(ctx, factory)
+
+    stages = {
+        "paths": lambda: factory.factoryPath.calculateAll(factory.machine_dict, factory.wall_dict, factory.creator.bb),
+        "routes": lambda: factory.factoryPath.calculateRoutes(factory.dfMF),
+        "collisions": lambda: factory.factoryRating.findCollisions(),
+        "mfIntersection": lambda: factory.factoryRating.evaluateMFIntersection(),
+        "evaluate": lambda: factory.evaluate(),
+        "render": render,
+    }
+
+    #First evaluation creates the path graph and the rating object all single stages work on
+    factory.evaluate()
+    result = {"machines": len(factory.machine_dict),
+              "walls": len(factory.wall_dict),
+              "materialflows": len(factory.dfMF.index),
+              "pathNodes": factory.fullPathGraph.number_of_nodes() if factory.fullPathGraph else 0,
+              "time_ms": {},
+              "peak_mb": {}}
+
+    for name, stage in stages.items():
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            stage()
+            times.append(time.perf_counter() - start)
+        result["time_ms"][name] = float(np.median(times)) * 1000
+
+    tracemalloc.start()
+    for name, stage in stages.items():
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        stage()
+        result["peak_mb"][name] = (tracemalloc.get_traced_memory()[1] - current) / 2**20
+    tracemalloc.stop()
+    result["maxrss_mb"] = maxRSS()
+    surface.finish()
+    return result
+
+
+def scalingExponents(results):
+    """Slope of log(time) over log(machines) per stage, 1 is linear and 2 quadratic growth"""
+    machines = np.log([result["machines"] for result in results])
+    exponents = {}
+    for name in SCALING_STAGES:
+        times = np.array([result["time_ms"][name] for result in results])
+        if len(results) > 1 and np.all(times > 0):
+            exponents[name] = float(np.polyfit(machines, np.log(times), 1)[0])
+    return exponents
+
+
+def printScaling(results, exponents):
+    print(f"{'machines':>8} {'walls':>6} {'flows':>6}" + "".join(f" {name:>14}" for name in SCALING_STAGES) + "   (ms / peak MB)")
+    for result in results:
+        print(f"{result['machines']:8d} {result['walls']:6d} {result['materialflows']:6d}" + "".join(f" {result['time_ms'][name]:8.1f}/{result['peak_mb'][name]:5.1f}" for name in SCALING_STAGES))
+    print(f"{'exponent':>22}" + "".join(f" {exponents.get(name, float('nan')):14.2f}" for name in SCALING_STAGES))
+
+
+def cases(args):
+    if args.layouts:
+        for ifcpath in sorted(glob.glob(args.layouts)):
+            materialflowpath = ifcpath.replace(".ifc", "_mf.csv")
+            name = os.path.splitext(os.path.basename(ifcpath))[0]
+            yield name, ifcpath, materialflowpath if os.path.exists(materialflowpath) else None, args.factoryconfig
+    for factoryconfig in args.configs:
+        yield factoryconfig, None, None, factoryconfig
+
+
+def gitRevision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=basePath, capture_output=True, text=True, timeout=10).stdout.strip()
+    except Exception:
+        return None
+
+
+def printOverview(results):
+    print(f"{'case':<14} {'machines':>8} {'eval/s':>8} {'steps/s':>8}" + "".join(f" {span.split('/')[-1]:>12}" for span in OVERVIEW_SPANS))
+    for result in results:
+        means = [result["spans"].get(span, {}).get("mean_ms", float("nan")) for span in OVERVIEW_SPANS]
+        print(f"{result['name']:<14} {result['machines']:8d} {result.get('evaluate_per_s', float('nan')):8.2f} {result.get('env_steps_per_s', float('nan')):8.2f}" + "".join(f" {mean:12.2f}" for mean in means))
+
+
+def compare(results, previousPath, threshold):
+    """Prints the change of the mean span times against an earlier result file.
+
+    Returns:
+        int: number of spans that got slower by more than threshold
+    """
+    with open(previousPath, 'r') as f:
+        previous = {result["name"]: result for result in json.load(f)["cases"]}
+    regressions = 0
+    for result in results:
+        if result["name"] not in previous:
+            continue
+        for span, stat in result["spans"].items():
+            old = previous[result["name"]]["spans"].get(span)
+            if old is None or old["mean_ms"] <= 0:
+                continue
+            change = stat["mean_ms"] / old["mean_ms"] - 1
+            if abs(change) > threshold:
+                marker = "SLOWER" if change > 0 else "faster"
+                regressions += change > 0
+                print(f"{marker:<6} {result['name']:<14} {span:<45} {old['mean_ms']:10.2f} -> {stat['mean_ms']:10.2f} ms ({change:+.0%})")
+    return regressions
+
+
+def main():
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = os.path.join(basePath, "Output", f"benchmark_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+
+    meta = {"date": datetime.now().isoformat(),
+            "git": gitRevision(),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "seed": args.seed}
+
+    if args.scaling:
+        results = []
+        for amountMachines in args.scaling:
+            print(f"Benchmarking {amountMachines} machines", flush=True)
+            results.append(scalingCase(amountMachines, args))
+        exponents = scalingExponents(results)
+        with open(args.output, "w") as f:
+            json.dump({"meta": {**meta, "repeat": args.repeat}, "scaling": results, "exponents": exponents}, f, indent=2)
+        print(f"Results written to {args.output}")
+        printScaling(results, exponents)
+        return
+
+    results = []
+    for name, ifcpath, materialflowpath, factoryconfig in cases(args):
+        print(f"Benchmarking {name}", flush=True)
+        results.append(benchmarkCase(name, ifcpath, materialflowpath, factoryconfig, args))
+
+    with open(args.output, "w") as f:
+        json.dump({"meta": {**meta, "poses": args.poses, "steps": args.steps}, "cases": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+    printOverview(results)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"{regressions} spans got slower by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,6 @@ from shapely.geometry import box, MultiPoint, Polygon, MultiPolygon
 from shapely.affinity import rotate, scale, translate
 from shapely.ops import unary_union
 from shapely.prepared import prep
-import ifcopenshell
-from ifcopenshell.api import run
 from factorySim.factoryObject import FactoryObject
 from factorySim.utils import prepare_for_export
 from factorySim.utils import write_ifc_class
@@ -103,6 +101,75 @@ class FactoryCreator():
 
 
         return self.multi, self.bb
+
+    def create_scaled_factory(self, amountMachines: int, cellSize: float = 5000, hallCells: int = 5, wallThickness: float = 200) -> tuple:
+        """Create a synthetic factory with a given number of machines for scaling benchmarks.
+        Machines are placed on a jittered grid and never overlap. Halls of hallCells x hallCells machines are separated by walls with a door to every cell,
+        so walls and paths grow in proportion to the number of machines. The factory dimensions and bounding box are replaced.
+
+        Args:
+            amountMachines (int): Number of machines to create
+            cellSize (float, optional): Edge length of the grid cell of a single machine. Defaults to 5000.
+            hallCells (int, optional): Number of grid cells per hall side. Defaults to 5.
+            wallThickness (float, optional): Thickness of all walls. Defaults to 200.
+
+        Returns:
+            tuple: machine_dict and wall_dict
+        """
+        columns = math.ceil(math.sqrt(amountMachines))
+        rows = math.ceil(amountMachines / columns)
+        self.factoryWidth = columns * cellSize + wallThickness
+        self.factoryHeight = rows * cellSize + wallThickness
+        self.bb = box(0, 0, self.factoryWidth, self.factoryHeight)
+        self.prep_bb = prep(self.bb)
+
+        #Machines use between 25 % and 50 % of their cell, so there is space for walls and paths
+        self.machine_dict = {}
+        sizes = self.rng.uniform(0.25, 0.5, size=(amountMachines, 2)) * cellSize
+        for i, (width, height) in enumerate(sizes):
+            column, row = i % columns, i // columns
+            x = wallThickness + column * cellSize + self.rng.uniform(0.1 * cellSize, cellSize - width - 0.1 * cellSize - wallThickness)
+            y = wallThickness + row * cellSize + self.rng.uniform(0.1 * cellSize, cellSize - height - 0.1 * cellSize - wallThickness)
+            self.machine_dict[str(i)] = FactoryObject(gid=str(i),
+                                            name="M_" + str(i),
+                                            poly=MultiPolygon([box(x, y, x + width, y + height)]),
+                                            color=self.rng.random(size=3)
+                                            )
+
+        #Outer walls and hall walls along the grid lines, with a door in the middle of every cell
+        segments = []
+        door = cellSize * 0.4
+        for column in range(0, columns + 1):
+            x = column * cellSize
+            if column % hallCells == 0 or column == columns:
+                for row in range(rows):
+                    y = row * cellSize
+                    if column in (0, columns):
+                        segments.append(box(x, y, x + wallThickness, y + cellSize + wallThickness))
+                    else:
+                        segments.append(box(x, y, x + wallThickness, y + (cellSize - door) / 2))
+                        segments.append(box(x, y + (cellSize + door) / 2, x + wallThickness, y + cellSize + wallThickness))
+        for row in range(0, rows + 1):
+            y = row * cellSize
+            if row % hallCells == 0 or row == rows:
+                for column in range(columns):
+                    x = column * cellSize
+                    if row in (0, rows):
+                        segments.append(box(x, y, x + cellSize + wallThickness, y + wallThickness))
+                    else:
+                        segments.append(box(x, y, x + (cellSize - door) / 2, y + wallThickness))
+                        segments.append(box(x + (cellSize + door) / 2, y, x + cellSize + wallThickness, y + wallThickness))
+
+        self.wall_dict = {}
+        for i, segment in enumerate(segments):
+            self.wall_dict[f"W_{i}"] = FactoryObject(gid=f"W_{i}",
+                                            name=f"Wall_{i}",
+                                            poly=MultiPolygon([segment]),
+                                            color=(0.5, 0.5, 0.5)
+                                            )
+
+        return self.machine_dict, self.wall_dict
+
     def load_dxf_factory(self, filename):
         # Broken TODO
         import ezdxf
@@ -132,6 +199,8 @@ class FactoryCreator():
         Returns:
             dict: _description_
         """
+        #ifcopenshell is only needed for loading and saving, random factories are created without it
+        import ifcopenshell
         ifc_file = ifcopenshell.open(ifc_file_path)
         element_dict = {}
         elements = []
@@ -201,7 +270,6 @@ class FactoryCreator():
             name = element.Name if element.Name else element.GlobalId
             element_dict[element.GlobalId] = FactoryObject(gid=element.GlobalId, 
                                                             name=name,
-                                                            origin=(origin[0], origin[1]),
                                                             poly=singleElement,
                                                             color=self.rng.random(size=3),
                                                             rotation = rotation
@@ -221,10 +289,8 @@ class FactoryCreator():
             self.factoryHeight = bbox[3] - bbox[1]
 
         for element in element_dict.values():
+            #Setting a new shape also moves the origin to the lower left corner of its bounding box
             element.poly = scale(element.poly, yfact=-1, origin=self.bb.centroid)
-            polybbox = element.poly.bounds
-            element.origin = (polybbox[0], polybbox[1])
-            element.center = element.poly.representative_point()
         
         if elementName == "IFCBUILDINGELEMENTPROXY":
             self.machine_dict = element_dict
@@ -302,6 +368,9 @@ class FactoryCreator():
         if bb is None:    
             bb = self.bb
 
+        import ifcopenshell
+        from ifcopenshell.api import run
+
         # Create a blank model
         model = ifcopenshell.file()
 
@@ -24,6 +24,9 @@ class MyXceptionModel(TorchModelV2, nn.Module):
 
     def forward(self, input_dict, state, seq_lens):
         self._features = input_dict["obs"].float()
+        #uint8 observations are scaled to the 0-1 range of float observations
+        if input_dict["obs"].dtype == torch.uint8:
+            self._features = self._features / 255.0
         # Permuate b/c data comes in as [B, dim, dim, channels]:
         self._features = self._features.permute(0, 3, 1, 2)
         conv_out = self.model(self._features)
@@ -79,6 +79,9 @@ class TimmEncoder(TorchModel, Encoder):
 
     def _forward(self, input_dict, **kwargs):
         t_in = input_dict["obs"].permute(0, 3, 1, 2).float()
+        #uint8 observations are scaled to the 0-1 range of float observations
+        if input_dict["obs"].dtype == torch.uint8:
+            t_in = t_in / 255.0
         print(f"Raw----------------------------- {input_dict['obs'].shape}")
         print(f"---------------------------------- {input_dict['obs'].max()}")
         print(f"---------------------------------- {input_dict['obs'].dtype}")
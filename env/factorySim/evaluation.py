@@ -0,0 +1,115 @@
+import threading
+
+from factorySim.factorySimClass import EvaluationCancelled
+
+
+class EvaluationService():
+    """Evaluates snapshots of a factory on a background thread.
+
+    Only the newest submitted layout is waiting at any time, older ones are dropped.
+    Submitting a new layout cancels the running evaluation at its next stage, so a stream of edits
+    never waits for more than the evaluation that is currently finishing its stage.
+    Results are published as a whole and can be taken over with FactorySim.adoptEvaluation.
+
+    Args:
+        rewardMode (int, optional): reward function passed to evaluate. Defaults to 1.
+    """
+
+    def __init__(self, rewardMode=1):
+        self.rewardMode = rewardMode
+        self.submitted = 0 # Number of the last submitted snapshot
+        self.cancelledCount = 0
+        self.droppedCount = 0
+        self._result = None
+        self._published = 0
+        self._taken = 0
+        self._pending = None
+        self._running = False
+        self._cancel = threading.Event()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread = threading.Thread(target=self._run, name="evaluation", daemon=True)
+        self._thread.start()
+
+    @property
+    def busy(self):
+        """True while a snapshot is evaluated or waiting"""
+        with self._lock:
+            return self._running or self._pending is not None
+
+    def submit(self, factory):
+        """Snapshots the current layout of factory and evaluates it as soon as the thread is free
+
+        Args:
+            factory (FactorySim): factory edited by the caller, it is not touched by the evaluation
+
+        Returns:
+            int: number of the snapshot, increasing with every call
+        """
+        snapshot = factory.snapshot()
+        with self._lock:
+            self.submitted += 1
+            if self._pending is not None:
+                self.droppedCount += 1
+            self._pending = (self.submitted, snapshot)
+            #The running evaluation is outdated now
+            self._cancel.set()
+            self._wake.notify()
+            return self.submitted
+
+    def takeResult(self):
+        """Newest result that was not taken before
+
+        Returns:
+            tuple: number of the snapshot, evaluated snapshot and the return value of evaluate, or None
+        """
+        with self._lock:
+            if self._published == self._taken:
+                return None
+            self._taken = self._published
+            return self._result
+
+    def isCurrent(self, number):
+        """True if no snapshot was submitted after the one with number"""
+        with self._lock:
+            return number == self.submitted
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._cancel.set()
+            self._wake.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._pending is None and not self._closed:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                number, snapshot = self._pending
+                self._pending = None
+                self._running = True
+                cancel = self._cancel = threading.Event()
+
+            try:
+                output = snapshot.evaluate(self.rewardMode, cancelled=cancel)
+            except EvaluationCancelled:
+                with self._lock:
+                    self.cancelledCount += 1
+                    self._running = False
+                continue
+            except Exception as e:
+                print(e)
+                print("Error in evaluate")
+                with self._lock:
+                    self._running = False
+                continue
+
+            #A finished evaluation is published even if a newer snapshot is waiting, its results are complete and only slightly older
+            with self._lock:
+                self._result = (number, snapshot, output)
+                self._published += 1
+                self._running = False
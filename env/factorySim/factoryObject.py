@@ -1,29 +1,143 @@
 
 import random
 import numpy as np
-from shapely.geometry import Polygon, MultiPolygon, box
-from shapely.affinity import translate, rotate, scale
+import shapely
+from shapely.geometry import Point, Polygon, MultiPolygon, box
+from shapely.ops import polylabel
 
 class FactoryObject:
+    """Lightweight representation of a machine or wall.
+
+    The object keeps its canonical base shape together with a pose (origin, rotation).
+    Every pose is a single affine transform of the base coordinates, so repeated moves do not accumulate errors.
+    The transformed polygon, its center and bounds are only calculated when they are requested.
+    """
+
+    __slots__ = ("gid", "name", "group", "rotation", "_color", "_origin",
+                 "_basePoly", "_baseRotation", "_baseCoords", "_baseAnchor", "_baseLabels",
+                 "_matrix", "_localCoords", "_localBounds",
+                 "_poly", "_center", "_labels")
+
+    def __init__(self, gid="not_set", name="no_name", origin=None, poly:Polygon=box(0.0, 0.0, 1.0, 1.0), color=None, rotation=0):
 
-    def __init__(self, gid="not_set", name="no_name", origin=(0,0), poly:Polygon=box(0.0, 0.0, 1.0, 1.0), color=None, rotation=0):
-        
         self.gid = gid
         self.name = name
-        if color is None or not np.any(color):
-            self.color = [random.random(), random.random(), random.random()]
-        else:
-            self.color = color
-        self.origin = origin 
+        self.group = None
+        #Random color is only created when it is used
+        self._color = None if color is None or not np.any(color) else color
         self.rotation = rotation # roational change
         self.poly = poly #Element Multi Polygon Representation
+        if origin is not None:
+            self.translate_Item(*origin)
+
+
+    @property
+    def color(self):
+        if self._color is None:
+            self._color = [random.random(), random.random(), random.random()]
+        return self._color
+
+    @color.setter
+    def color(self, value):
+        self._color = value
+
+
+    @property
+    def poly(self) -> MultiPolygon:
+        """Polygon of the item in factory space, calculated on first access after a pose change"""
+        if self._poly is None:
+            coords = self._rotated() + self._offset()
+            self._poly = shapely.transform(self._basePoly, lambda _: coords)
+        return self._poly
+
+    @poly.setter
+    def poly(self, poly: MultiPolygon) -> None:
+        """Replaces the base shape of the item. The current rotation is used as rotation of the new shape."""
         bounds = poly.bounds
-        self.width = bounds[2] - bounds[0]
-        self.height =  bounds[3] - bounds[1]
-        self.center = poly.representative_point()
-        self.group = None
+        #Base coordinates are stored relative to the center of the bounding box, which is the pivot for rotations
+        baseCenter = np.array([(bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2])
+        self._basePoly = poly
+        self._baseRotation = self.rotation
+        self._baseCoords = shapely.get_coordinates(poly) - baseCenter
+        self._baseAnchor = None
+        self._baseLabels = None
+        self._matrix = np.eye(2)
+        self._localCoords = self._baseCoords
+        self._localBounds = (bounds[0] - baseCenter[0], bounds[1] - baseCenter[1], bounds[2] - baseCenter[0], bounds[3] - baseCenter[1])
+        self._origin = (bounds[0], bounds[1])
+        self._poly = poly
+        self._center = None
+        self._labels = None
+
+    @property
+    def origin(self) -> tuple:
+        return self._origin
+
+    @origin.setter
+    def origin(self, origin: tuple) -> None:
+        self.translate_Item(*origin)
+
+    @property
+    def width(self) -> float:
+        self._rotated()
+        return self._localBounds[2] - self._localBounds[0]
+
+    @property
+    def height(self) -> float:
+        self._rotated()
+        return self._localBounds[3] - self._localBounds[1]
+
+    @property
+    def bounds(self) -> tuple:
+        """Bounds of the item in factory space (xmin, ymin, xmax, ymax) without creating the polygon"""
+        return (self._origin[0], self._origin[1], self._origin[0] + self.width, self._origin[1] + self.height)
+
+    @property
+    def center(self) -> Point:
+        """Point inside the item, used as start and end of material flows.
+        The representative point of the base shape is moved with the pose, so it stays inside the item without a new polygon."""
+        if self._center is None:
+            if self._baseAnchor is None:
+                anchor = self._basePoly.representative_point()
+                bounds = self._basePoly.bounds
+                self._baseAnchor = np.array([anchor.x - (bounds[0] + bounds[2]) / 2, anchor.y - (bounds[1] + bounds[3]) / 2])
+            self._rotated()
+            x, y = self._matrix @ self._baseAnchor + self._offset()
+            self._center = Point(x, y)
+        return self._center
+
+    def labelAnchors(self) -> np.ndarray:
+        """Positions for the name of the item, one row (x, y) for every polygon of poly.
+        The poles of inaccessibility are calculated once on the base shape and moved with the pose."""
+        if self._labels is None:
+            if self._baseLabels is None:
+                bounds = self._basePoly.bounds
+                baseCenter = np.array([(bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2])
+                self._baseLabels = np.array([polylabel(poly, tolerance=1000).coords[0] for poly in getattr(self._basePoly, "geoms", [self._basePoly])]) - baseCenter
+            self._rotated()
+            self._labels = self._baseLabels @ self._matrix.T + self._offset()
+        return self._labels
+
+
+    def _rotated(self) -> np.ndarray:
+        """Base coordinates rotated to the current rotation, cached until the rotation changes"""
+        if self._localCoords is None:
+            angle = self.rotation - self._baseRotation
+            cos, sin = np.cos(angle), np.sin(angle)
+            matrix = np.array([[cos, -sin], [sin, cos]])
+            coords = self._baseCoords @ matrix.T
+            minimum = coords.min(axis=0)
+            maximum = coords.max(axis=0)
+            #Coordinates are set last, so concurrent readers never see them together with old bounds
+            self._matrix = matrix
+            self._localBounds = (minimum[0], minimum[1], maximum[0], maximum[1])
+            self._localCoords = coords
+        return self._localCoords
+
+    def _offset(self) -> np.ndarray:
+        """Translation from rotated base coordinates to factory space"""
+        return np.array([self._origin[0] - self._localBounds[0], self._origin[1] - self._localBounds[1]])
 
-    
 
     def rotate_Item(self, r: float) -> None:
         """_summary_ Rotate the item to the given angle in radians
@@ -31,16 +145,31 @@ class FactoryObject:
         Args:
             r (float): Rotation in radians
         """
+        if r == self.rotation:
+            return
+
+        self._rotated()
+        oldBounds = self._localBounds
+        #Current center of the bounding box in factory space is the pivot of the rotation
+        pivotX = self._origin[0] + (oldBounds[2] - oldBounds[0]) / 2
+        pivotY = self._origin[1] + (oldBounds[3] - oldBounds[1]) / 2
 
+        #Where the old bounding box center ends up when rotating around the center of the base shape
         rotShift = r - self.rotation
-        self.rotation = r
-        self.poly = rotate(self.poly, rotShift, origin='center', use_radians=True)
+        offsetX = (oldBounds[0] + oldBounds[2]) / 2
+        offsetY = (oldBounds[1] + oldBounds[3]) / 2
+        cos, sin = np.cos(rotShift), np.sin(rotShift)
+        movedX = offsetX * cos - offsetY * sin
+        movedY = offsetX * sin + offsetY * cos
 
-        self.center = self.poly.representative_point()
-        bounds = self.poly.bounds
-        self.width = bounds[2] - bounds[0]
-        self.height =  bounds[3] - bounds[1]
-        self.origin = (bounds[0], bounds[1])
+        self.rotation = r
+        self._localCoords = None
+        self._rotated()
+        newBounds = self._localBounds
+        self._origin = (newBounds[0] + pivotX - movedX, newBounds[1] + pivotY - movedY)
+        self._poly = None
+        self._center = None
+        self._labels = None
 
 
     def translate_Item(self, x: float, y: float) -> None:
@@ -50,30 +179,26 @@ class FactoryObject:
             x (float): x Coordinate in factory space
             y (float): y Coordinate in factory space
         """
-                    
-        xShift = x - self.origin[0]
-        yShift = y - self.origin[1]
-        self.origin = (x, y)
-        self.poly = translate(self.poly, xShift, yShift)
-        self.center = self.poly.representative_point()
+        if (x, y) == self._origin:
+            return
+        self._origin = (x, y)
+        self._poly = None
+        self._center = None
+        self._labels = None
 
 
-    def __del__(self):
-        del(self.poly)
 
 
-
- 
 def main():
     testmachine = FactoryObject("AABBAA")
-    complexmachine = FactoryObject("COMPLEX", 1, 2, 3)
+    complexmachine = FactoryObject("COMPLEX", "complex", (1, 2))
+
 
 
+    print(F"Testmachine: {testmachine.gid}, {testmachine.origin[0]}, {testmachine.origin[1]}")
+    print(F"Testmachine: {complexmachine.gid}, {complexmachine.origin[0]}, {complexmachine.origin[1]}")
 
-    print(F"Testmachine: {testmachine.gid}, {testmachine.origin.x}, {testmachine.origin.y}, {testmachine.origin.z}")
-    print(F"Testmachine: {complexmachine.gid}, {complexmachine.origin.x}, {complexmachine.origin.y}, {complexmachine.origin.z}")
 
- 
 
 if __name__ == "__main__":
     main()
@@ -1,27 +1,40 @@
 #!/usr/bin/env python3
 
 import os
+import copy
+import atexit
 import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-from time import time
+from time import time, perf_counter
 
 import numpy as np
-import cairo
 import pandas as pd
 
 from factorySim.creation import FactoryCreator
 import factorySim.baseConfigs as baseConfigs
-from factorySim.rendering import  draw_BG, drawFactory, drawCollisions
-from factorySim.kpi import FactoryRating
+from factorySim.kpi import FactoryRating, KPIStats, KPI_REGISTRY, KPI_KEYS, FAST_KPIS
 from factorySim.routing import FactoryPath
+from factorySim.profiling import Profiler
 from shapely.ops import unary_union, snap
 from shapely.geometry import MultiPolygon, Polygon
 
+#Keys of the rating dict, in the order used for structured rating arrays
+RATING_KEYS = ('Reward', 'TotalRating', 'EvaluationResult') + KPI_KEYS
+RATING_DTYPE = np.dtype([(key, np.float64) for key in RATING_KEYS] + [("terminated", np.bool_), ("failed", np.bool_)])
+#Attributes evaluate writes, taken over from an evaluated snapshot by adoptEvaluation
+EVALUATION_RESULTS = ("fullPathGraph", "reducedPathGraph", "walkableArea", "factoryRating", "RatingDict", "currentRating", "currentMappedRating", "lastRating",
+                      "pathPolygon", "extendedPathPolygon", "MachinesFarFromPath", "usedSpacePolygonDict", "freeSpacePolygon", "growingSpacePolygon",
+                      "freespaceAlongRoutesPolygon", "MFIntersectionPoints", "machineCollisionList", "wallCollisionList", "outsiderList", "collisionAfterLastUpdate")
+
+class EvaluationCancelled(Exception):
+    """Raised by FactorySim.evaluate when its cancel event is set. The factory is left with partial results."""
+
 class FactorySim:
  #------------------------------------------------------------------------------------------------------------
  # Loading
  #------------------------------------------------------------------------------------------------------------
-    def __init__(self, path_to_ifc_file=None, path_to_materialflow_file = None, factoryConfig=baseConfigs.SMALLSQUARE, randSeed = int(time()), randomPos = False, createMachines = False, verboseOutput = 0, maxMF_Elements = None):
+    def __init__(self, path_to_ifc_file=None, path_to_materialflow_file = None, factoryConfig=baseConfigs.SMALLSQUARE, randSeed = int(time()), randomPos = False, createMachines = False, verboseOutput = 0, maxMF_Elements = None, kpiWorkers = 0, disabledKPIs = (), profiler = None):
         self.FACTORYDIMENSIONS = (factoryConfig.WIDTH, factoryConfig.HEIGHT) # if something is read from file this is overwritten
         self.DRAWINGORIGIN = (0,0)
         self.MAXMF_ELEMENTS = maxMF_Elements
@@ -34,12 +47,20 @@ class FactorySim:
             randSeed=randSeed
             )
         self.verboseOutput = verboseOutput
+        self.kpiWorkers = kpiWorkers # Threads for independent KPI groups, more than 1 runs them on a thread pool, shapely releases the GIL in most of them
+        self.disabledKPIs = set(disabledKPIs) # Names from KPI_REGISTRY that are skipped, disabled stages also skip the metrics using them
+        unknownKPIs = self.disabledKPIs - KPI_REGISTRY.keys()
+        if unknownKPIs:
+            raise ValueError(f"Unknown KPIs {sorted(unknownKPIs)} in disabledKPIs, use names from KPI_REGISTRY: {list(KPI_REGISTRY)}")
+        self.kpiStats = KPIStats()
+        #Stage timings, printed for verboseOutput >= 3. A shared profiler can be passed in to collect over many factories.
+        self.profiler = profiler if profiler is not None else Profiler(enabled=verboseOutput >= 3, echo=verboseOutput >= 3)
+        self.profiler.start()
         self.pathPolygon = None
         self.MFIntersectionPoints = None
         self.rng = np.random.default_rng(randSeed)
             
         self.timezero = time()
-        self.lasttime = 0      
         self.lastRating = 0  
         self.RatingDict = {}
         self.MachinesFarFromPath = set()
@@ -65,8 +86,7 @@ class FactorySim:
         else:
             self.wall_dict = {}
 
-        if(self.verboseOutput >= 1):
-            self.printTime("IFCWALL geparsed")
+        self.profiler.lap("load/IFCWALL")
 
         #Create Random Machines
         if createMachines:
@@ -87,12 +107,7 @@ class FactorySim:
                 self.machine_dict = self.creator.load_ifc_factory(self.ifc_file, "IFCBUILDINGELEMENTPROXY")
 
 
-            if(self.verboseOutput >= 3):
-                self.printTime("Datei geladen")
-
-
-        if(self.verboseOutput >= 1):
-            self.printTime("IFCBUILDINGELEMENTPROXY geparsed")
+        self.profiler.lap("load/IFCBUILDINGELEMENTPROXY")
 
         #Update Dimensions after Loading
         self.FACTORYDIMENSIONS = (self.creator.factoryWidth, self.creator.factoryHeight)
@@ -104,6 +119,7 @@ class FactorySim:
             factoryConfig.MAXPATHWIDTH,
             factoryConfig.MINTWOWAYPATHWIDTH,
             factoryConfig.SIMPLIFICATIONANGLE)
+        self.factoryPath.profiler = self.profiler
 
 
         self.lastRating = 0
@@ -133,8 +149,7 @@ class FactorySim:
         self.dfMF = self.creator.cleanMaterialFLow(self.dfMF)
         
     
-        if(self.verboseOutput >= 3):
-            self.printTime("Materialfluss geladen")
+        self.profiler.lap("load/Materialflow")
  #------------------------------------------------------------------------------------------------------------
  # Update Materialflow
  #------------------------------------------------------------------------------------------------------------
@@ -167,75 +182,74 @@ class FactorySim:
             if(self.verboseOutput >= 2):
                 print(f"Update: {self.machine_dict[machineIndex].name} - X: {xPosition:1.1f} Y: {yPosition:1.1f} R: {rotation:1.2f} ")
 
-            if (rotation is not None):
-                mappedRot = np.interp(rotation, (-1.0, 1.0), (0, 2*np.pi))
-                self.machine_dict[machineIndex].rotate_Item(mappedRot)
+            with self.profiler.span("update"):
+                self.applyPose(self.machine_dict[machineIndex], xPosition, yPosition, rotation)
+        else:
+             if(self.verboseOutput >= 2):
+                print(f"Update: {self.machine_dict[machineIndex].name} - Skipped Update")
 
-            bbox = self.creator.bb.bounds #bbox is a tuple of (xmin, ymin, xmax, ymax)
-            #Max Value should move machine to the rightmost or topmost position without moving out of the image
-            #np.interp also Clips Position to Output Range
-                    
-            mappedXPos = np.interp(xPosition, (-1.0, 1.0), (0, bbox[2] - self.machine_dict[machineIndex].width))  
-            mappedYPos = np.interp(yPosition, (-1.0, 1.0), (0, bbox[3] - self.machine_dict[machineIndex].height)) 
 
+    def applyPose(self, machine, xPosition : float, yPosition: float, rotation: float = None):
+        """Moves a machine to a pose given in the normalized action space of the environment
 
-            self.machine_dict[machineIndex].translate_Item(mappedXPos, mappedYPos)
+        Args:
+            machine (FactoryObject): machine to move
+            xPosition (float): x position between -1 and 1
+            yPosition (float): y position between -1 and 1
+            rotation (float, optional): rotation between -1 and 1. Defaults to None.
+        """
+        if (rotation is not None):
+            mappedRot = np.interp(rotation, (-1.0, 1.0), (0, 2*np.pi))
+            machine.rotate_Item(mappedRot)
 
-            if(self.verboseOutput >= 3):
-                self.printTime(f"{self.machine_dict[machineIndex].name} geupdated")
-        else:
-             if(self.verboseOutput >= 2):
-                print(f"Update: {self.machine_dict[machineIndex].name} - Skipped Update")
+        bbox = self.creator.bb.bounds #bbox is a tuple of (xmin, ymin, xmax, ymax)
+        #Max Value should move machine to the rightmost or topmost position without moving out of the image
+        #np.interp also Clips Position to Output Range
+                
+        mappedXPos = np.interp(xPosition, (-1.0, 1.0), (0, bbox[2] - machine.width))  
+        mappedYPos = np.interp(yPosition, (-1.0, 1.0), (0, bbox[3] - machine.height)) 
 
+        machine.translate_Item(mappedXPos, mappedYPos)
 
     
  #------------------------------------------------------------------------------------------------------------
  # Evaluation
  #------------------------------------------------------------------------------------------------------------
-    def evaluate(self, rewardMode = 1):
+    def evaluate(self, rewardMode = 1, cancelled = None):
+        """Calculates paths, routes and all KPIs of the current layout
 
+        Args:
+            rewardMode (int, optional): reward function. Defaults to 1.
+            cancelled (threading.Event, optional): checked between the stages, raises EvaluationCancelled once it is set. Defaults to None.
+
+        Returns:
+            tuple: mapped rating, rating, RatingDict, terminated
+        """
+
+        evaluationStart = perf_counter()
         self.RatingDict = {}
         #In case caluclation fails set default rating
         self.currentRating = -5
 
         
-        self.fullPathGraph, self.reducedPathGraph, self.walkableArea = self.factoryPath.calculateAll(self.machine_dict, self.wall_dict, self.creator.bb)
+        with self.profiler.span("evaluate/Paths"):
+            self.fullPathGraph, self.reducedPathGraph, self.walkableArea = self.factoryPath.calculateAll(self.machine_dict, self.wall_dict, self.creator.bb)
+        _checkCancelled(cancelled)
         if self.fullPathGraph and self.reducedPathGraph and self.walkableArea is not None:
             self.dfMF = self.factoryPath.calculateRoutes(self.dfMF)
-            
-
-            if(self.verboseOutput >= 3):
-                self.printTime("Pfadbewertung abgeschlossen")
-
-            self.factoryRating = FactoryRating(machine_dict=self.machine_dict, wall_dict=self.wall_dict, fullPathGraph=self.fullPathGraph, reducedPathGraph=self.reducedPathGraph, prepped_bb=self.creator.prep_bb, dfMF=self.dfMF)
-
-            self.RatingDict["ratingCollision"] = self.evaluateCollision()    
-            if(self.verboseOutput >= 3):
-                self.printTime("Kollisionsbewertung abgeschlossen")
-
-            self.RatingDict["ratingMF"] = self.factoryRating.evaluateMF(self.creator.bb) 
-            self.RatingDict["ratingTrueMF"] = self.factoryRating.evaluateTrueMF(self.creator.bb)
-            #sort MF Dict for Rendering
-            self.dfMF.sort_values(by=['intensity_sum_norm'], inplace=True, ascending=False) 
-            self.RatingDict["MFIntersection"], self.MFIntersectionPoints = self.factoryRating.evaluateMFIntersection()        
-            if(self.verboseOutput >= 3):
-                self.printTime("Bewertung des Materialfluss abgeschlossen")
-
-            self.pathPolygon, self.extendedPathPolygon = self.factoryRating.PathPolygon()
-            self.MachinesFarFromPath = self.factoryRating.getMachinesFarFromPath(self.extendedPathPolygon)
-            self.RatingDict["routeAccess"] = self.factoryRating.evaluateRouteAccess(self.MachinesFarFromPath)
-            self.RatingDict["pathEfficiency"] = self.factoryRating.PathEfficiency()
-            #20 % of the maximum dimension of the factory as grouping threshold
-            self.usedSpacePolygonDict, self.machine_dict = self.factoryRating.UsedSpacePolygon(max(self.FACTORYDIMENSIONS) * 0.2)
-            self.freeSpacePolygon, self.growingSpacePolygon = self.factoryRating.FreeSpacePolygon(self.pathPolygon, self.walkableArea, self.usedSpacePolygonDict)
-            self.RatingDict["areaUtilisation"] = self.factoryRating.evaluateAreaUtilisation(self.walkableArea, self.freeSpacePolygon)
-            self.RatingDict["Scalability"] = self.factoryRating.evaluateScalability(self.growingSpacePolygon)
-            #Currently not used, does not make relevant difference
-            self.factoryRating.evaluateCompactness(self.usedSpacePolygonDict)
-            self.freespaceAlongRoutesPolygon = self.factoryRating.FreeSpaceRoutesPolygon(self.pathPolygon)
-            self.RatingDict["routeContinuity"] = self.factoryRating.evaluateRouteContinuity()
-            self.RatingDict["routeWidthVariance"] =self.factoryRating.PathWidthVariance()
-            self.RatingDict["Deadends"] =self.factoryRating.evaluateDeadends()
+            self.profiler.lap("evaluate/Routes")
+            _checkCancelled(cancelled)
+
+            self.factoryRating = FactoryRating(machine_dict=self.machine_dict, wall_dict=self.wall_dict, fullPathGraph=self.fullPathGraph, reducedPathGraph=self.reducedPathGraph, prepped_bb=self.creator.prep_bb, dfMF=self.dfMF, edgeAngles=self.factoryPath.nodeAngles.get("edge_angle"))
+
+            kpiResults = runTaskGraph(self.kpiTasks(), _kpiPool(self.kpiWorkers), cancelled=cancelled)
+            #Machine groups are applied after the task graph joined, other tasks iterate the machines while usedSpace runs
+            for gid, group in (kpiResults.get("usedSpace") or {}).items():
+                self.machine_dict[gid].group = group
+            for name in KPI_KEYS:
+                if kpiResults.get(name) is not None:
+                    self.RatingDict[name] = kpiResults[name]
+            self.profiler.lap("evaluate/KPIs")
             
 
 
@@ -244,19 +258,17 @@ class FactorySim:
 
             match rewardMode:
                 case 1:
-                    # Rating is 0 if no collision, -1 if collision
-                    partialRatings = np.array([v for k, v in self.RatingDict.items() if k != "TotalRating" and k != "terminated"])
-                    weights = np.ones_like(partialRatings)
+                    # Rating is 0 if no collision, -1 if collision. Without the collision KPI every layout counts as free of collisions.
+                    partialRatings, weights = self.partialRatings(exclude=("TotalRating", "terminated"))
 
-                    if(self.RatingDict.get("ratingCollision", -1) >= 0.5):
+                    if("ratingCollision" in self.disabledKPIs or self.RatingDict.get("ratingCollision", -1) >= 0.5):
                         self.currentRating = np.average(partialRatings, weights=weights)
                     else: 
                         self.currentRating = -1
 
                 case 2:
                     # Rating the difference to the last rating
-                    partialRatings = np.array([v for k, v in self.RatingDict.items() if k != "TotalRating" and k != "terminated" and k != "EvaluationResult"])
-                    weights = np.ones_like(partialRatings)
+                    partialRatings, weights = self.partialRatings(exclude=("TotalRating", "terminated", "EvaluationResult"))
 
                     self.currentRating = np.average(partialRatings, weights=weights)
                     self.RatingDict["EvaluationResult"] = self.currentRating
@@ -269,8 +281,7 @@ class FactorySim:
 
                 case 3:
                     # Weighted average of all ratings
-                    partialRatings = np.array([v for k, v in self.RatingDict.items() if k != "TotalRating" and k != "terminated"])
-                    weights = np.ones_like(partialRatings)
+                    partialRatings, weights = self.partialRatings(exclude=("TotalRating", "terminated"))
                     self.currentRating = np.average(partialRatings, weights=weights)
 
 
@@ -308,49 +319,190 @@ class FactorySim:
         #done = False      
 
 
-        if(self.verboseOutput >= 3):
-            self.printTime("Bewertung des Layouts abgeschlossen")
+        self.profiler.lap("evaluate/Reward")
+        self.profiler.record("evaluate", evaluationStart, perf_counter())
         if(self.verboseOutput >= 1):
             print(self.generateRatingText(multiline=True))
 
         return self.currentMappedRating, self.currentRating, self.RatingDict, self.RatingDict["terminated"]
 
+    def evaluateFast(self):
+        """Collisions, straight line material flow and material flow intersections of the current layout, without path finding.
+        The values replace their entries in the RatingDict, all other entries stay at the result of the last full evaluation.
+
+        Returns:
+            dict: name -> value of the fast KPIs that are not disabled
+        """
+        start = perf_counter()
+        #Own rating object, the one of the last full evaluation still holds its paths
+        factoryRating = FactoryRating(machine_dict=self.machine_dict, wall_dict=self.wall_dict, prepped_bb=self.creator.prep_bb, dfMF=self.dfMF)
+        results = {name: compute(self, factoryRating) for name, compute in FAST_KPIS.items() if name not in self.disabledKPIs}
+        self.RatingDict.update(results)
+        self.profiler.record("evaluateFast", start, perf_counter())
+        return results
+
+    def snapshot(self):
+        """Copy of the factory for evaluating the current layout on another thread.
+        Results of the last evaluation and the intermediate geometry of the path finder are not copied, evaluate replaces them anyway.
+        Profiler and kpiStats are shared with this factory, both are thread safe.
+
+        Returns:
+            FactorySim: independent copy of machines, walls, materialflow and path finder
+        """
+        #Deepcopy returns what the memo holds for an id, so old results are left out without touching this factory
+        memo = {id(value): None for name in EVALUATION_RESULTS
+                if (value := getattr(self, name, None)) is not None and not isinstance(value, (int, float, str))}
+        memo.update({id(value): None for name in FactoryPath.INTERMEDIATE_RESULTS
+                     if (value := getattr(self.factoryPath, name, None)) is not None})
+        memo.update({id(self.profiler): self.profiler, id(self.kpiStats): self.kpiStats})
+        return copy.deepcopy(self, memo)
+
+    def adoptEvaluation(self, other, materialflow = True):
+        """Takes over the results of a snapshot evaluated with evaluate, the snapshot must not be used afterwards
+
+        Args:
+            other (FactorySim): evaluated snapshot of this factory
+            materialflow (bool, optional): also take dfMF with its routes, only if machines and materialflow did not change since the snapshot.
+                Otherwise only the routes are taken, they have to match the adopted graphs. Defaults to True.
+        """
+        for name in EVALUATION_RESULTS:
+            value = getattr(other, name, None)
+            if value is not None:
+                setattr(self, name, value)
+        self.factoryPath = other.factoryPath
+        if materialflow:
+            self.dfMF = other.dfMF
+        elif self.dfMF is not None and other.dfMF is not None and "routes" in other.dfMF.columns:
+            #Flows added since the snapshot have no route in the adopted graphs, they get one with the next evaluation
+            routes = {(row.source, row.target): (row.routes, row.trueDistances) for row in other.dfMF.itertuples()}
+            adopted = [routes.get(key, ([], np.nan)) for key in zip(self.dfMF["source"], self.dfMF["target"])]
+            self.dfMF["routes"] = [route for route, _ in adopted]
+            self.dfMF["trueDistances"] = [distance for _, distance in adopted]
+
+    def evaluate_batch(self, poses, rewardMode = 1, workers = 0, executor = "thread"):
+        """Evaluates many layouts of this factory in one call
+
+        Args:
+            poses (np.ndarray): array of shape (B, n, 3) holding x, y and rotation between -1 and 1 for all n machines of B layouts
+            rewardMode (int, optional): reward function passed to evaluate. Defaults to 1.
+            workers (int, optional): number of workers to split the batch on. 0 or 1 evaluates in this process. Defaults to 0.
+            executor (str, optional): "thread" or "process" pool for workers > 1. Defaults to "thread".
+
+        Returns:
+            tuple: rewards of shape (B,) and a structured array of shape (B,) with one field per key in RATING_KEYS, "terminated" and "failed".
+            Layouts where evaluate raised are logged with their traceback and marked as failed, their ratings are NaN.
+            Without workers the factory is left in the last layout of the batch.
+        """
+        poses = np.asarray(poses, dtype=np.float64)
+        if poses.ndim != 3 or poses.shape[1] != len(self.machine_dict) or poses.shape[2] != 3:
+            raise ValueError(f"Expected poses of shape (B, {len(self.machine_dict)}, 3), got {poses.shape}")
+
+        if workers <= 1 or len(poses) <= 1:
+            return self._evaluate_poses(poses, rewardMode)
+
+        chunks = np.array_split(poses, min(workers, len(poses)))
+        if executor == "thread":
+            #every thread needs its own machines, paths and materialflow table
+            pool = ThreadPoolExecutor(max_workers=len(chunks))
+            factories = [copy.deepcopy(self) for _ in chunks]
+            #the profiler is thread safe, so all copies report into the one of this factory
+            for factory in factories:
+                factory.profiler = factory.factoryPath.profiler = self.profiler
+        elif executor == "process":
+            pool = ProcessPoolExecutor(max_workers=len(chunks))
+            factories = [self for _ in chunks]
+        else:
+            raise ValueError(f"Unknown executor {executor}, use 'thread' or 'process'")
+
+        with pool:
+            results = list(pool.map(_evaluate_poses, factories, chunks, [rewardMode] * len(chunks)))
+
+        rewards = np.concatenate([result[0] for result in results])
+        ratings = np.concatenate([result[1] for result in results])
+        for result in results:
+            self.kpiStats.merge(result[2])
+        return rewards, ratings
+
+    def _evaluate_poses(self, poses, rewardMode):
+        rewards = np.empty(len(poses), dtype=np.float64)
+        ratings = np.zeros(len(poses), dtype=RATING_DTYPE)
+        machines = list(self.machine_dict.values())
+
+        for i, layout in enumerate(poses):
+            for machine, (x, y, r) in zip(machines, layout):
+                self.applyPose(machine, x, y, r)
+            try:
+                _, rewards[i], ratingDict, terminated = self.evaluate(rewardMode)
+                failed = False
+            except Exception:
+                logging.exception(f"Error in evaluate of layout {i} of the batch")
+                rewards[i] = np.nan
+                ratingDict = {}
+                terminated = failed = True
+            ratings[i] = tuple(ratingDict.get(key, np.nan) for key in RATING_KEYS) + (terminated, failed)
+
+        return rewards, ratings
+
+    def kpiTasks(self):
+        """Tasks for all entries of KPI_REGISTRY, timed into kpiStats.
+        Disabled entries and entries depending on a skipped stage are replaced by tasks returning None, so the order of the rest stays the same.
+
+        Returns:
+            dict: name -> (names of tasks that have to be finished before, function without arguments)
+        """
+        tasks = {}
+        skipped = set()
+        for name, kpi in KPI_REGISTRY.items():
+            if name in self.disabledKPIs or any(i in skipped and KPI_REGISTRY[i].label is None for i in kpi.inputs):
+                skipped.add(name)
+                tasks[name] = (kpi.inputs, lambda: None)
+            else:
+                tasks[name] = (kpi.inputs, self._timedKPI(name, kpi.compute))
+        return tasks
+
+    def _timedKPI(self, name, compute):
+        def run():
+            start = perf_counter()
+            result = compute(self)
+            end = perf_counter()
+            self.kpiStats.record(name, end - start)
+            self.profiler.record("kpi/" + name, start, end)
+            return result
+        return run
+
+    def partialRatings(self, exclude=()):
+        """Values of the RatingDict that are averaged into the reward together with their weights from KPI_REGISTRY"""
+        keys = [k for k in self.RatingDict if k not in exclude]
+        partialRatings = np.array([self.RatingDict[k] for k in keys], dtype=np.float64)
+        weights = np.array([KPI_REGISTRY[k].weight if k in KPI_REGISTRY else 1.0 for k in keys], dtype=np.float64)
+        return partialRatings, weights
+
     def generateRatingText(self, multiline=False):
         if(multiline):
             con = "\n"
         else:
             con = " | "
-        return (f"REWARD              : {self.RatingDict.get('TotalRating', -100): 1.2f}{con}"
-                f"Evaluation Result   : {self.RatingDict.get('EvaluationResult', 0): 1.2f}{con}"
-                f"Material Flow       : {self.RatingDict.get('ratingMF', -100): 1.2f}{con}"
-                f"True Material Flow  : {self.RatingDict.get('ratingTrueMF', -100): 1.2f}{con}"
-                f"MF Intersections    : {self.RatingDict.get('MFIntersection', -100): 1.2f}{con}"
-                f"Collisions          : {self.RatingDict.get('ratingCollision', -100): 1.2f}{con}"
-                f"Route Continuity    : {self.RatingDict.get('routeContinuity', -100): 1.2f}{con}"
-                f"Route Width Variance: {self.RatingDict.get('routeWidthVariance', -100): 1.2f}{con}"
-                f"Dead Ends           : {self.RatingDict.get('Deadends', -100): 1.2f}{con}"
-                f"Route Access        : {self.RatingDict.get('routeAccess', -100): 1.2f}{con}"
-                f"Path Efficiency     : {self.RatingDict.get('pathEfficiency', -100): 1.2f}{con}"
-                f"Area Utilization    : {self.RatingDict.get('areaUtilisation', -100): 1.2f}{con}"
-                f"Scalability         : {self.RatingDict.get('Scalability', -100): 1.2f}{con}"
-
-                )
+        text = (f"REWARD              : {self.RatingDict.get('TotalRating', -100): 1.2f}{con}"
+                f"Evaluation Result   : {self.RatingDict.get('EvaluationResult', 0): 1.2f}{con}")
+        for name in KPI_KEYS:
+            if name not in self.disabledKPIs:
+                text += f"{KPI_REGISTRY[name].label:<20}: {self.RatingDict.get(name, -100): 1.2f}{con}"
+        return text
 
  #------------------------------------------------------------------------------------------------------------
-    def evaluateCollision(self):
+    def evaluateCollision(self, factoryRating=None):
+        factoryRating = factoryRating or self.factoryRating
         
-        self.collisionAfterLastUpdate = self.factoryRating.findCollisions(self.lastUpdatedMachine)                 
-        if(self.verboseOutput >= 3):
-            self.printTime("Kollisionen berechnen abgeschlossen")      
+        self.collisionAfterLastUpdate = factoryRating.findCollisions(self.lastUpdatedMachine)                 
 
-        self.machineCollisionList = self.factoryRating.machineCollisionList
-        self.wallCollisionList = self.factoryRating.wallCollisionList
-        self.outsiderList = self.factoryRating.outsiderList
+        self.machineCollisionList = factoryRating.machineCollisionList
+        self.wallCollisionList = factoryRating.wallCollisionList
+        self.outsiderList = factoryRating.outsiderList
 
         #print(len(list(combinations(self.machine_list.values(), 2))))
-        nMachineCollisions = len(self.factoryRating.machineCollisionList)
-        nWallCollosions = len(self.factoryRating.wallCollisionList)
-        nOutsiders = len(self.factoryRating.outsiderList)
+        nMachineCollisions = len(factoryRating.machineCollisionList)
+        nWallCollosions = len(factoryRating.wallCollisionList)
+        nOutsiders = len(factoryRating.outsiderList)
 
 
         #If latest update leads to collision give worst rating.
@@ -368,9 +520,29 @@ class FactorySim:
  #------------------------------------------------------------------------------------------------------------
  # Drawing
  #------------------------------------------------------------------------------------------------------------
-    def provideCairoDrawingData(self, width, height, scale=None):
-        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
-        ctx = cairo.Context(surface)
+    def provideCairoDrawingData(self, width, height, scale=None, surface=None, ctx=None, surfaceFormat=None):
+        """Surface and context for drawing this factory, transformed from factory coordinates to pixels
+
+        Args:
+            width (int): width of the surface in pixels
+            height (int): height of the surface in pixels
+            scale (float, optional): pixels per factory unit. Defaults to None, which fits the factory into the surface.
+            surface (cairo.ImageSurface, optional): surface of an earlier call, reused if it has the same size. Defaults to None.
+            ctx (cairo.Context, optional): context of the reused surface, only its transformation is reset. Defaults to None.
+            surfaceFormat (cairo.Format, optional): pixel format of a new surface. Defaults to None, which is cairo.FORMAT_ARGB32.
+
+        Returns:
+            tuple: surface, ctx
+        """
+        #cairo is only needed for drawing, evaluations run without it
+        import cairo
+        if surfaceFormat is None:
+            surfaceFormat = cairo.FORMAT_ARGB32
+        if surface is None or ctx is None or surface.get_width() != width or surface.get_height() != height or surface.get_format() != surfaceFormat:
+            surface = cairo.ImageSurface(surfaceFormat, width, height)
+            ctx = cairo.Context(surface)
+        else:
+            ctx.identity_matrix()
         if scale:
             self.scale = scale
         else:
@@ -383,19 +555,75 @@ class FactorySim:
         return surface, ctx
 
 
- #------------------------------------------------------------------------------------------------------------
- # Helpers  
- #------------------------------------------------------------------------------------------------------------
-    
-    def printTime(self, text):
-        number = (time() - self.timezero - self.lasttime)
-        self.lasttime += number
-        number = round(number * 1000, 2)
-        print(f"{number:6.2f} - {text}")
 
+#------------------------------------------------------------------------------------------------------------
+def runTaskGraph(tasks, executor=None, cancelled=None):
+    """Runs tasks that depend on each other
+
+    Args:
+        tasks (dict): name -> (names of tasks that have to be finished before, function without arguments)
+        executor (Executor, optional): runs independent tasks concurrently. Without executor the tasks run one after another in the given order.
+        cancelled (threading.Event, optional): no further task is started once it is set, raises EvaluationCancelled. Defaults to None.
+
+    Returns:
+        dict: name -> return value of the function, in the order of tasks
+    """
+    results = {}
+    if executor is None:
+        for name, (dependencies, function) in tasks.items():
+            _checkCancelled(cancelled)
+            results[name] = function()
+        return results
+
+    pending = dict(tasks)
+    running = {}
+    while pending or running:
+        if cancelled is not None and cancelled.is_set():
+            #Tasks already started are finished, shapely calls can not be interrupted
+            wait(running)
+            raise EvaluationCancelled()
+        for name, (dependencies, function) in list(pending.items()):
+            if all(dependency in results for dependency in dependencies):
+                running[executor.submit(function)] = name
+                del pending[name]
+        if not running:
+            raise ValueError(f"Unresolvable dependencies for {list(pending)}")
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[running.pop(future)] = future.result()
+
+    return {name: results[name] for name in tasks}
+
+def _checkCancelled(cancelled):
+    if cancelled is not None and cancelled.is_set():
+        raise EvaluationCancelled()
+
+_KPI_POOLS = {}
+def _kpiPool(workers):
+    #Thread pools are shared between factories, so FactorySim stays copyable and picklable. A single worker would only add overhead, so it evaluates sequentially.
+    if workers <= 1:
+        return None
+    if workers not in _KPI_POOLS:
+        _KPI_POOLS[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kpi")
+    return _KPI_POOLS[workers]
+
+@atexit.register
+def shutdownKPIPools():
+    """Stops the threads of all KPI pools, a later evaluation with kpiWorkers creates a new pool"""
+    while _KPI_POOLS:
+        _, pool = _KPI_POOLS.popitem()
+        pool.shutdown(wait=True)
+
+#------------------------------------------------------------------------------------------------------------
+def _evaluate_poses(factory, poses, rewardMode):
+    #Module level function so it can be sent to worker processes. Each worker works on a copy, so it starts with empty stats.
+    factory.kpiStats = KPIStats()
+    rewards, ratings = factory._evaluate_poses(poses, rewardMode)
+    return rewards, ratings, factory.kpiStats
 
 #------------------------------------------------------------------------------------------------------------
 def main():
+    from factorySim.rendering import  draw_BG, drawFactory, drawCollisions
 
     img_resolution = (500, 500)
     outputfile ="Out"
@@ -434,7 +662,7 @@ def main():
         "Output", 
         F"{outputfile}_machines.png")
     surface.write_to_png(path) 
-    demoFactory.printTime("PNG schreiben")
+    demoFactory.profiler.lap("PNG schreiben")
     
 
 
@@ -450,6 +678,7 @@ def main():
     demoFactory.update(1,-1 ,-1 , 0.2)
     ##Rate current Layout
     demoFactory.evaluate()
+    print(demoFactory.kpiStats)
 
     draw_BG(ctx, demoFactory.DRAWINGORIGIN, *img_resolution)
     drawFactory(ctx, demoFactory.machine_dict, demoFactory.wall_dict, demoFactory.dfMF, drawNames=False, drawOrigin = True, drawMachineCenter = True, highlight=0)
@@ -460,7 +689,7 @@ def main():
         "Output", 
         F"{outputfile}_machines_update.png")
     surface.write_to_png(path) 
-    demoFactory.printTime("PNG schreiben")
+    demoFactory.profiler.lap("PNG schreiben")
     
     #Machine Collisions Output to PNG
     drawCollisions(ctx, demoFactory.machineCollisionList, demoFactory.wallCollisionList)
@@ -470,12 +699,13 @@ def main():
         "Output", 
         F"{outputfile}_machine_collisions.png")
     surface.write_to_png(path) 
-    demoFactory.printTime("PNG schreiben")
+    demoFactory.profiler.lap("PNG schreiben")
 
     
 
 
     print(f"Total runtime: {round((time() - demoFactory.timezero) * 1000, 2)}")
+    print(demoFactory.profiler)
 
     
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 import os
-import yaml
+from time import perf_counter
+from typing import TYPE_CHECKING
 
 import gymnasium as gym
 from gymnasium import error, spaces
@@ -7,15 +8,18 @@ from gymnasium import error, spaces
 
 import numpy as np
 import cairo
-from tqdm import tqdm
 
-from factorySim.factorySimClass import FactorySim
-from ray.rllib.env.env_context import EnvContext
-from ray.rllib.env.multi_agent_env import make_multi_agent
+from factorySim.factorySimClass import FactorySim, shutdownKPIPools
+from factorySim.kpi import KPI_KEYS
+from factorySim.profiling import Profiler, MemoryTracker
 
 import factorySim.baseConfigs as baseConfigs
+
+if TYPE_CHECKING:
+    from ray.rllib.env.env_context import EnvContext
 from factorySim.rendering import  draw_BG, drawFactory, drawCollisions, draw_detail_paths, draw_text, drawMaterialFlow
-from factorySim.rendering import draw_obs_layer_A, draw_obs_layer_B
+from factorySim.rendering import draw_obs_layer_A, draw_obs_layer_B, A8ObservationRenderer
+from factorySim.rasterizer import NumpyObservationRenderer
 
 
 
@@ -24,7 +28,7 @@ class FactorySimEnv(gym.Env):
     metadata = {'render_modes': ['human', 'rgb_array']}
 
     #Expects input ifc file. Other datafiles have to have the same path and filename. 
-    def __init__(self, env_config: EnvContext, render_mode=None):
+    def __init__(self, env_config: "EnvContext", render_mode=None):
         super().__init__()
         print(env_config)
         self.evaluationMode = env_config["evaluation"]
@@ -39,6 +43,17 @@ class FactorySimEnv(gym.Env):
         self.maxMF_Elements = env_config["maxMF_Elements"]
         self.createMachines = env_config["createMachines"]
         self.scale = env_config["outputScale"]
+        self.kpiWorkers = env_config.get("kpiWorkers", 0)
+        self.disabledKPIs = env_config.get("disabledKPIs", None) or ()
+        #Collects stage timings over all episodes of this environment, export with self.profiler.exportJSON or exportChromeTrace
+        self.profiler = Profiler(enabled=env_config.get("profile", False))
+        #Memory report every n resets, added to the info dict of all steps until the next report
+        self.memoryTracker = None
+        self.memoryReport = None
+        if env_config.get("memoryTracking", 0):
+            from shapely.geometry.base import BaseGeometry
+            import networkx as nx
+            self.memoryTracker = MemoryTracker(env_config["memoryTracking"], countTypes={"shapely_geometries": BaseGeometry, "networkx_graphs": nx.Graph, "cairo_surfaces": cairo.Surface, "factories": FactorySim})
         self.evalFiles = [None]
         self.currentEvalEnv = None
         self.seed = env_config["randomSeed"]
@@ -74,7 +89,9 @@ class FactorySimEnv(gym.Env):
         assert self.render_mode is None or self.render_mode in self.metadata["render_modes"]
         
         self.surface = None
+        self.ctx = None
         self.rsurface = None
+        self.rctx = None
         self.prefix = env_config.get("prefix", "0") 
 
         self.info = {}
@@ -87,8 +104,27 @@ class FactorySimEnv(gym.Env):
         self.action_space = spaces.Box(low=-1, high=1, shape=(3,), dtype=np.float64)
 
         if self._obs_type == 'image':
-            #self.observation_space = spaces.Box(low=0, high=255, shape=(self.width, self.height, 2), dtype=np.uint8)
-            self.observation_space = spaces.Box(low=0.0, high=1.0, shape=(self.width, self.height, 2), dtype=np.float64)
+            #uint8 observations hold the raw grey values 0-255, float observations are scaled to 0-1
+            self.obsDtype = np.dtype(env_config.get("obs_dtype", "float64"))
+            if self.obsDtype == np.uint8:
+                self.observation_space = spaces.Box(low=0, high=255, shape=(self.width, self.height, 2), dtype=np.uint8)
+            elif self.obsDtype in (np.float16, np.float32, np.float64):
+                self.observation_space = spaces.Box(low=0.0, high=1.0, shape=(self.width, self.height, 2), dtype=self.obsDtype)
+            else:
+                raise error.Error('Unsupported observation dtype: {}'.format(self.obsDtype))
+            #Both layers are written into this buffer, observations are copies of it
+            self._obsBuffer = np.empty((self.width, self.height, 2), dtype=np.uint8)
+            #"cairo" draws the layers one after another on an ARGB surface, "cairo_a8" in a single pass on two A8 surfaces,
+            #"numpy" rasterizes them without cairo and without antialiasing
+            self.obsBackend = env_config.get("obs_backend", "cairo")
+            if self.obsBackend == "cairo":
+                self.obsRenderer = None
+            elif self.obsBackend == "cairo_a8":
+                self.obsRenderer = A8ObservationRenderer(self.width, self.height)
+            elif self.obsBackend == "numpy":
+                self.obsRenderer = NumpyObservationRenderer(self.width, self.height)
+            else:
+                raise error.Error('Unrecognized observation backend: {}'.format(self.obsBackend))
         else:
             raise error.Error('Unrecognized observation type: {}'.format(self._obs_type))
 
@@ -96,10 +132,13 @@ class FactorySimEnv(gym.Env):
 
 
     def step(self, action):
+        stepStart = perf_counter()
         if not np.isnan(action[0]) :
             self.factory.update(self.currentMachine, action[0], action[1], action[2], 0)
 
         self.tryEvaluate()
+        if self.memoryReport:
+            self.info["memory"] = self.memoryReport
 
         self.stepCount += 1
         self.currentMachine += 1
@@ -112,8 +151,11 @@ class FactorySimEnv(gym.Env):
             self.info["Image"] = self.render()
             self.info["Step"] = self.stepCount
             self.info["evalEnvID"] = self.currentEvalEnv
-     
-        return (self._get_obs(), self.currentMappedReward, self.terminated, False, self.info)
+
+        with self.profiler.span("env/observation"):
+            observation = self._get_obs()
+        self.profiler.record("env/step", stepStart, perf_counter())
+        return (observation, self.currentMappedReward, self.terminated, False, self.info)
 
     def reset(self, seed=None, options={}):
         if seed is not None:
@@ -139,17 +181,20 @@ class FactorySimEnv(gym.Env):
         createMachines=self.createMachines,
         randSeed = self.seed,
         verboseOutput=self.Loglevel,
-        maxMF_Elements = self.maxMF_Elements)
+        maxMF_Elements = self.maxMF_Elements,
+        kpiWorkers = self.kpiWorkers,
+        disabledKPIs = self.disabledKPIs,
+        profiler = self.profiler if self.profiler.enabled else None)
         self.info = {}
-        if self.surface:
-            self.surface.finish()
-            del(self.surface)
-        if self.rsurface:
-            self.rsurface.finish()
-            del(self.rsurface)
-        self.surface, self.ctx = self.factory.provideCairoDrawingData(self.width, self.height)
-        self.rsurface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.width * self.scale, self.height*self.scale)
-        self.rctx = cairo.Context(self.rsurface)
+        #Surfaces keep their size over all episodes, only the transformation for the new factory is set
+        self.surface, self.ctx = self.factory.provideCairoDrawingData(self.width, self.height, surface=self.surface, ctx=self.ctx)
+        if self.rsurface is None:
+            self.rsurface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.width * self.scale, self.height*self.scale)
+            self.rctx = cairo.Context(self.rsurface)
+        else:
+            self.rctx.identity_matrix()
+        if self.obsRenderer:
+            self.obsRenderer.setup(self.factory)
 
         self.rctx.scale(self.scale*self.factory.scale, self.scale*self.factory.scale)
         self.rctx.translate(-self.factory.creator.bb.bounds[0], -self.factory.creator.bb.bounds[1])
@@ -163,6 +208,10 @@ class FactorySimEnv(gym.Env):
         
 
         self.tryEvaluate()
+        if self.memoryTracker:
+            self.memoryReport = self.memoryTracker.update() or self.memoryReport
+            if self.memoryReport:
+                self.info["memory"] = self.memoryReport
 
         if self.evaluationMode:
             self.info["Evaluation"] = True
@@ -220,36 +269,38 @@ class FactorySimEnv(gym.Env):
         #new Version greyscale
         machineToHighlight = highlight if not highlight is None else str(self.currentMachine)
 
-        draw_obs_layer_A(self.ctx, self.factory, highlight=machineToHighlight)
-
-        buf = self.surface.get_data()
-
-        machines_greyscale = np.ndarray(shape=(self.width, self.height, 4), dtype=np.uint8, buffer=buf)[...,[2]]
-        #self.surface.write_to_png(os.path.join(self.output_path, f"{self.prefix}_{self.uid}_{self.stepCount:04d}_agent_1_collision.png"))
+        if self.obsRenderer:
+            self.obsRenderer.render(self.factory, self._obsBuffer, highlight=machineToHighlight)
+        else:
+            pixels = np.ndarray(shape=(self.width, self.height, 4), dtype=np.uint8, buffer=self.surface.get_data())
 
-        #separate Image for Materialflow
-        draw_obs_layer_B(self.ctx, self.factory, highlight=machineToHighlight)
+            draw_obs_layer_A(self.ctx, self.factory, highlight=machineToHighlight)
+            self._obsBuffer[..., 0] = pixels[..., 2]
+            #self.surface.write_to_png(os.path.join(self.output_path, f"{self.prefix}_{self.uid}_{self.stepCount:04d}_agent_1_collision.png"))
 
-        buf = self.surface.get_data()
+            #separate Image for Materialflow
+            draw_obs_layer_B(self.ctx, self.factory, highlight=machineToHighlight)
+            self._obsBuffer[..., 1] = pixels[..., 2]
+            #self.surface.write_to_png(os.path.join(self.output_path, f"{self.prefix}_{self.uid}_{self.stepCount:04d}_agent_2_materialflow.png"))
 
-        materialflow_greyscale = np.ndarray(shape=(self.width, self.height, 4), dtype=np.uint8, buffer=buf)[...,[2]]
-        #self.surface.write_to_png(os.path.join(self.output_path, f"{self.prefix}_{self.uid}_{self.stepCount:04d}_agent_2_materialflow.png"))
-        #Format (width, height, 2)
-        output = np.concatenate((machines_greyscale, materialflow_greyscale), axis=2)
-        
-        return output/ 255.0
+        #Format (width, height, 2), RLlib keeps references to observations, so the buffer is never returned itself
+        if self.obsDtype == np.uint8:
+            return self._obsBuffer.copy()
+        return np.divide(self._obsBuffer, 255.0, dtype=self.obsDtype)
     
       
 
     def close(self):
         if self.surface:
             self.surface.finish()
-            del(self.surface)
-            del(self.ctx)
+            self.surface = None
+            self.ctx = None
         if self.rsurface:
             self.rsurface.finish()
-            del(self.rsurface)
-            del(self.rctx)
+            self.rsurface = None
+            self.rctx = None
+        if self.kpiWorkers > 1:
+            shutdownKPIPools()
 
     def tryEvaluate(self):
         try:
@@ -264,7 +315,14 @@ class FactorySimEnv(gym.Env):
         
         
 
-MultiFactorySimEnv = make_multi_agent(lambda config: FactorySimEnv(config))
+def __getattr__(name):
+    #RLlib is only imported when the multi agent version is used
+    global MultiFactorySimEnv
+    if name == "MultiFactorySimEnv":
+        from ray.rllib.env.multi_agent_env import make_multi_agent
+        MultiFactorySimEnv = make_multi_agent(lambda config: FactorySimEnv(config))
+        return MultiFactorySimEnv
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 #------------------------------------------------------------------------------------------------------------
@@ -277,6 +335,8 @@ def main():
     
     import wandb
     import datetime
+    import yaml
+    from tqdm import tqdm
 
 
     #filename = "Long"
@@ -312,7 +372,7 @@ def main():
     env.prefix="test"
     
     
-    ratingkeys = ['Reward', 'TotalRating', 'ratingCollision', 'ratingMF', 'ratingTrueMF', 'MFIntersection', 'routeAccess', 'pathEfficiency', 'areaUtilisation', 'Scalability', 'routeContinuity', 'routeWidthVariance', 'Deadends','terminated',]
+    ratingkeys = ['Reward', 'TotalRating', *KPI_KEYS, 'terminated']
     tbl = wandb.Table(columns=["evalFile", "evalFile.Step", "image"] + ratingkeys)
 
     
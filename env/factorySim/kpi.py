@@ -1,3 +1,6 @@
+import json
+import threading
+from collections import namedtuple
 import networkx as nx
 import numpy as np
 from itertools import combinations
@@ -5,14 +8,13 @@ from shapely.geometry import Polygon, MultiPolygon, LineString, Point
 from shapely.ops import unary_union, snap
 from shapely.prepared import prep
 from shapely import set_precision, intersection
-import scipy.cluster.hierarchy as hcluster
 
 
 
 DEBUG = False
 class FactoryRating():
 
-    def __init__(self, machine_dict=None, wall_dict=None, fullPathGraph=None, reducedPathGraph=None, prepped_bb=None, dfMF=None):
+    def __init__(self, machine_dict=None, wall_dict=None, fullPathGraph=None, reducedPathGraph=None, prepped_bb=None, dfMF=None, edgeAngles=None):
 
         self.machine_dict = machine_dict
         self.wall_dict = wall_dict
@@ -20,6 +22,7 @@ class FactoryRating():
         self.reducedPathGraph = reducedPathGraph
         self.prepped_bb = prepped_bb
         self.dfMF = dfMF
+        self.edgeAngles = edgeAngles # Array from FactoryPath.nodeAngles, read from the node attributes of fullPathGraph if not given
  #------------------------------------------------------------------------------------------------------------
     def PathWidthVariance(self):
         '''Calculates the Variance of the pathwidths for all subroutes between crossroads and deadends'''
@@ -98,15 +101,23 @@ class FactoryRating():
             return MultiPolygon(), MultiPolygon()
  #------------------------------------------------------------------------------------------------------------
     def UsedSpacePolygon(self, threshold):           
+        """Convex hulls of machines grouped by the distance of their centers.
+        Machines are not changed, so other KPIs can read them at the same time.
+
+        Returns:
+            tuple: group -> hull and machine gid -> group
+        """
         machineCenters = np.array([x.center.coords[0] for x in self.machine_dict.values()])
         if len(machineCenters) <= 1: 
-            return {}, self.machine_dict
+            return {}, {}
         
+        import scipy.cluster.hierarchy as hcluster
         clusters = hcluster.fclusterdata(machineCenters, threshold, criterion="distance")
         grouped = {value+1: [] for value in range(len(set(clusters)))}
 
+        groups = {}
         for clusterID, machine in zip(clusters, self.machine_dict.values()):
-            machine.group = clusterID
+            groups[machine.gid] = clusterID
             grouped[clusterID].append(machine.poly)
 
         hulls={}
@@ -114,7 +125,7 @@ class FactoryRating():
             hulls[key] = MultiPolygon([unary_union(value).convex_hull])
 
 
-        return hulls, self.machine_dict
+        return hulls, groups
  #------------------------------------------------------------------------------------------------------------
     def FreeSpaceRoutesPolygon(self, pathPolygon):
         polys = []
@@ -216,16 +227,13 @@ class FactoryRating():
         return collisionAfterLastUpdate
 
 
- #------------------------------------------------------------------------------------------------------------
-    def evaluateMF_Helper(self, source, sink): 
-        source_center = self.machine_dict[source].center
-        sink_center = self.machine_dict[sink].center
-        return np.sqrt(np.power(source_center.x-sink_center.x,2) + np.power(source_center.y-sink_center.y,2))
-
  #------------------------------------------------------------------------------------------------------------
     def evaluateMF(self, boundingBox):
         if len(self.dfMF.index) > 0:
-            self.dfMF['distance'] = self.dfMF.apply(lambda row: self.evaluateMF_Helper(row['source'], row['target']), axis=1)
+            centers = {key: machine.center.coords[0] for key, machine in self.machine_dict.items()}
+            source = np.array([centers[key] for key in self.dfMF['source']])
+            target = np.array([centers[key] for key in self.dfMF['target']])
+            self.dfMF['distance'] = np.sqrt(np.power(source[:,0]-target[:,0],2) + np.power(source[:,1]-target[:,1],2))
             #sum of all costs /  maximum intensity (intensity sum norm * 1) 
             #find longest distance possible in factory
             maxDistance = max(boundingBox.bounds[2],  boundingBox.bounds[3])
@@ -284,7 +292,10 @@ class FactoryRating():
  #------------------------------------------------------------------------------------------------------------
     def evaluateRouteContinuity(self):
         #angleList holds smallest angle in degrees between two edges (0-180)
-        angleList = np.array(list(nx.get_node_attributes(self.fullPathGraph, "edge_angle").values()))
+        if self.edgeAngles is not None:
+            angleList = np.asarray(self.edgeAngles)
+        else:
+            angleList = np.array(list(nx.get_node_attributes(self.fullPathGraph, "edge_angle").values()))
         #No bends == best Rating
         numBends = len(angleList)
         if numBends == 0: return 1
@@ -316,6 +327,134 @@ class FactoryRating():
         else:
             return MultiPolygon()
 
+ #------------------------------------------------------------------------------------------------------------
+ # Registry
+ #------------------------------------------------------------------------------------------------------------
+#Metrics have a label and end up in the RatingDict, stages only calculate intermediate results stored on the factory.
+#Stages must not change machines, other entries read them on other threads.
+#inputs names the entries that have to be finished before, cost is one of "cheap", "medium" or "expensive"
+#and weight is used for the averaged reward.
+KPI = namedtuple("KPI", ["label", "inputs", "cost", "weight", "compute"])
+
+def _stagePathPolygon(factory):
+    factory.pathPolygon, factory.extendedPathPolygon = factory.factoryRating.PathPolygon()
+    factory.MachinesFarFromPath = factory.factoryRating.getMachinesFarFromPath(factory.extendedPathPolygon)
+
+def _stageUsedSpace(factory):
+    #20 % of the maximum dimension of the factory as grouping threshold
+    factory.usedSpacePolygonDict, groups = factory.factoryRating.UsedSpacePolygon(max(factory.FACTORYDIMENSIONS) * 0.2)
+    #Currently not used, does not make relevant difference
+    factory.factoryRating.evaluateCompactness(factory.usedSpacePolygonDict)
+    #Written to the machines by FactorySim.evaluate once all tasks finished
+    return groups
+
+def _stageFreeSpace(factory):
+    factory.freeSpacePolygon, factory.growingSpacePolygon = factory.factoryRating.FreeSpacePolygon(factory.pathPolygon, factory.walkableArea, factory.usedSpacePolygonDict)
+
+def _stageFreeSpaceRoutes(factory):
+    factory.freespaceAlongRoutesPolygon = factory.factoryRating.FreeSpaceRoutesPolygon(factory.pathPolygon)
+
+def _stageMaterialflowOrder(factory):
+    #sort MF Dict for Rendering
+    factory.dfMF.sort_values(by=['intensity_sum_norm'], inplace=True, ascending=False)
+
+def _metricMFIntersection(factory, factoryRating=None):
+    if factoryRating is None:
+        factoryRating = factory.factoryRating
+    rating, factory.MFIntersectionPoints = factoryRating.evaluateMFIntersection()
+    return rating
+
+#Listed in an order that satisfies all inputs. All entries touching dfMF are chained, so they never run concurrently.
+KPI_REGISTRY = {
+    "pathPolygon": KPI(None, (), "expensive", 0, _stagePathPolygon),
+    "usedSpace": KPI(None, (), "expensive", 0, _stageUsedSpace),
+    "freeSpace": KPI(None, ("pathPolygon", "usedSpace"), "expensive", 0, _stageFreeSpace),
+    "freeSpaceRoutes": KPI(None, ("pathPolygon",), "medium", 0, _stageFreeSpaceRoutes),
+    "ratingCollision": KPI("Collisions", (), "cheap", 1.0, lambda factory: factory.evaluateCollision()),
+    "ratingMF": KPI("Material Flow", (), "cheap", 1.0, lambda factory: factory.factoryRating.evaluateMF(factory.creator.bb)),
+    "ratingTrueMF": KPI("True Material Flow", ("ratingMF",), "cheap", 1.0, lambda factory: factory.factoryRating.evaluateTrueMF(factory.creator.bb)),
+    "materialflowOrder": KPI(None, ("ratingTrueMF",), "cheap", 0, _stageMaterialflowOrder),
+    "MFIntersection": KPI("MF Intersections", ("materialflowOrder",), "expensive", 1.0, _metricMFIntersection),
+    "routeAccess": KPI("Route Access", ("pathPolygon",), "cheap", 1.0, lambda factory: factory.factoryRating.evaluateRouteAccess(factory.MachinesFarFromPath)),
+    "pathEfficiency": KPI("Path Efficiency", (), "medium", 1.0, lambda factory: factory.factoryRating.PathEfficiency()),
+    "areaUtilisation": KPI("Area Utilization", ("freeSpace",), "cheap", 1.0, lambda factory: factory.factoryRating.evaluateAreaUtilisation(factory.walkableArea, factory.freeSpacePolygon)),
+    "Scalability": KPI("Scalability", ("freeSpace",), "cheap", 1.0, lambda factory: factory.factoryRating.evaluateScalability(factory.growingSpacePolygon)),
+    "routeContinuity": KPI("Route Continuity", (), "medium", 1.0, lambda factory: factory.factoryRating.evaluateRouteContinuity()),
+    "routeWidthVariance": KPI("Route Width Variance", (), "cheap", 1.0, lambda factory: factory.factoryRating.PathWidthVariance()),
+    "Deadends": KPI("Dead Ends", (), "medium", 1.0, lambda factory: factory.factoryRating.evaluateDeadends()),
+}
+
+#Names of all metrics in the order they appear in the RatingDict
+KPI_KEYS = tuple(name for name, kpi in KPI_REGISTRY.items() if kpi.label is not None)
+#Metrics that only need the machine positions, calculated by FactorySim.evaluateFast without path finding.
+#They get the factory and a FactoryRating without paths.
+FAST_KPIS = {
+    "ratingCollision": lambda factory, factoryRating: factory.evaluateCollision(factoryRating),
+    "ratingMF": lambda factory, factoryRating: factoryRating.evaluateMF(factory.creator.bb),
+    "MFIntersection": _metricMFIntersection,
+}
+FAST_KPI_KEYS = tuple(FAST_KPIS)
+
+
+class KPIStats():
+    """Wall time and call counts of the registry entries, collected over a run"""
+
+    def __init__(self):
+        self.calls = {}
+        self.totalTime = {}
+        self.maxTime = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.totalTime[name] = self.totalTime.get(name, 0.0) + seconds
+            self.maxTime[name] = max(self.maxTime.get(name, 0.0), seconds)
+
+    def merge(self, other):
+        for name, calls in other.calls.items():
+            with self._lock:
+                self.calls[name] = self.calls.get(name, 0) + calls
+                self.totalTime[name] = self.totalTime.get(name, 0.0) + other.totalTime[name]
+                self.maxTime[name] = max(self.maxTime.get(name, 0.0), other.maxTime[name])
+
+    def reset(self):
+        with self._lock:
+            self.calls, self.totalTime, self.maxTime = {}, {}, {}
+
+    def summary(self):
+        """Returns:
+            dict: name -> calls, total, mean and max time in ms and the cost class, sorted by total time
+        """
+        with self._lock:
+            names = sorted(self.calls, key=lambda name: self.totalTime[name], reverse=True)
+            return {name: {"calls": self.calls[name],
+                           "total_ms": self.totalTime[name] * 1000,
+                           "mean_ms": self.totalTime[name] * 1000 / self.calls[name],
+                           "max_ms": self.maxTime[name] * 1000,
+                           "cost": KPI_REGISTRY[name].cost if name in KPI_REGISTRY else None}
+                    for name in names}
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def __str__(self):
+        lines = [f"{'KPI':<20} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+        for name, stat in self.summary().items():
+            lines.append(f"{name:<20} {stat['calls']:7d} {stat['total_ms']:10.2f} {stat['mean_ms']:9.2f} {stat['max_ms']:9.2f}")
+        return "\n".join(lines)
+
+    #Locks can not be copied or pickled, a copied stats object gets a new one
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
 if __name__ == "__main__":
     import matplotlib.pyplot as plt
     import os
@@ -0,0 +1,73 @@
+import threading
+from time import perf_counter
+
+
+class MQTTInbox():
+    """Collects MQTT messages from the network thread until the render loop drains them.
+
+    Position updates are coalesced per topic, only the latest one of every machine is kept.
+    They move to the end of the inbox, so a geometry message of the same machine that arrived before is still applied first.
+    All other messages are kept in order up to maxMessages, further ones are dropped and counted.
+
+    Args:
+        maxMessages (int, optional): number of waiting messages that are not coalesced. Defaults to 1000.
+        coalesceSuffixes (tuple, optional): topic endings of messages where only the latest one counts. Defaults to ("/pos", "/bg").
+    """
+
+    def __init__(self, maxMessages=1000, coalesceSuffixes=("/pos", "/bg")):
+        self.maxMessages = maxMessages
+        self.coalesceSuffixes = coalesceSuffixes
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._messages = {}
+        self._uncoalesced = 0
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def put(self, topic, payload):
+        """Called from the MQTT thread, never blocks"""
+        received = perf_counter()
+        with self._lock:
+            self.received += 1
+            if topic.endswith(self.coalesceSuffixes):
+                if self._messages.pop(topic, None) is not None:
+                    self.coalesced += 1
+                self._messages[topic] = (topic, payload, received)
+            elif self._uncoalesced >= self.maxMessages:
+                self.dropped += 1
+            else:
+                self._counter += 1
+                self._uncoalesced += 1
+                self._messages[self._counter] = (topic, payload, received)
+
+    def drain(self):
+        """Returns:
+            list: all waiting messages as (topic, payload, perf_counter time of arrival) in the order they are applied
+        """
+        with self._lock:
+            messages, self._messages = self._messages, {}
+            self._uncoalesced = 0
+        return list(messages.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._messages)
+
+    def stats(self):
+        with self._lock:
+            return {"received": self.received, "coalesced": self.coalesced, "dropped": self.dropped, "waiting": len(self._messages)}
+
+
+if __name__ == "__main__":
+    inbox = MQTTInbox(maxMessages=2)
+    inbox.put("EDF/BP/machines/1/pos", b'{"x": 1, "y": 1}')
+    inbox.put("EDF/BP/machines/2/geom", b'{"points": []}')
+    inbox.put("EDF/BP/machines/1/pos", b'{"x": 2, "y": 2}')
+    inbox.put("EDF/BP/machines/3/geom", b'[]')
+    inbox.put("EDF/BP/machines/4/geom", b'[]')
+    messages = inbox.drain()
+    assert [topic for topic, _, _ in messages] == ["EDF/BP/machines/2/geom", "EDF/BP/machines/1/pos", "EDF/BP/machines/3/geom"]
+    assert messages[1][1] == b'{"x": 2, "y": 2}'
+    assert inbox.stats() == {"received": 5, "coalesced": 1, "dropped": 1, "waiting": 0}
+    print(inbox.stats())
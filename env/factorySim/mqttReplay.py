@@ -0,0 +1,306 @@
+import json
+import queue
+import threading
+import argparse
+from collections import namedtuple
+from time import perf_counter, sleep
+
+import numpy as np
+
+from factorySim.mqttInbox import MQTTInbox
+from factorySim.profiling import Profiler
+
+
+MQTTMessage = namedtuple("MQTTMessage", ["topic", "payload"])
+
+
+def topicMatches(pattern, topic):
+    """MQTT topic filter matching with the + and # wildcards"""
+    patternLevels = pattern.split("/")
+    topicLevels = topic.split("/")
+    for i, level in enumerate(patternLevels):
+        if level == "#":
+            return True
+        if i >= len(topicLevels) or (level != "+" and level != topicLevels[i]):
+            return False
+    return len(patternLevels) == len(topicLevels)
+
+
+class LocalBroker():
+    """In-process stand-in for an MQTT broker, delivers every published message to all matching LocalClients"""
+
+    def __init__(self):
+        self.clients = []
+        self._lock = threading.Lock()
+
+    def publish(self, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            clients = list(self.clients)
+        for client in clients:
+            client._deliver(topic, payload)
+
+
+class LocalClient():
+    """Subset of the paho client used by factorySimLive, connected to a LocalBroker.
+    Messages are passed to on_message from a thread of the client, like paho does after loop_start."""
+
+    def __init__(self, broker, client_id=""):
+        self.broker = broker
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.subscriptions = []
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def connect(self, host=None, port=None):
+        with self.broker._lock:
+            self.broker.clients.append(self)
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+        return 0
+
+    def disconnect(self):
+        with self.broker._lock:
+            if self in self.broker.clients:
+                self.broker.clients.remove(self)
+        if self.on_disconnect:
+            self.on_disconnect(self, None, 0)
+
+    def subscribe(self, topic):
+        self.subscriptions.append(topic)
+
+    def publish(self, topic, payload):
+        self.broker.publish(topic, payload)
+
+    def loop_start(self):
+        self._thread = threading.Thread(target=self._loop, name="localmqtt", daemon=True)
+        self._thread.start()
+
+    def loop_stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def pending(self):
+        """Number of messages not yet passed to on_message"""
+        return self._queue.qsize()
+
+    def _deliver(self, topic, payload):
+        if any(topicMatches(pattern, topic) for pattern in self.subscriptions):
+            self._queue.put(MQTTMessage(topic, payload))
+
+    def _loop(self):
+        while (message := self._queue.get()) is not None:
+            if self.on_message:
+                self.on_message(self, None, message)
+
+
+#Broker factorySimLive connects to with mqtt_transport = "local"
+LOCAL_BROKER = LocalBroker()
+
+
+class Recorder():
+    """Writes all messages of a client into a json lines file, one object with t, topic and payload per message
+
+    Args:
+        path (str): output file
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "w")
+        self.start = perf_counter()
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def on_message(self, client, userdata, msg):
+        with self._lock:
+            json.dump({"t": perf_counter() - self.start, "topic": msg.topic, "payload": msg.payload.decode("utf-8", errors="replace")}, self.file)
+            self.file.write("\n")
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+
+
+def loadRecording(path):
+    """Returns:
+        list: (time, topic, payload) of a file written by Recorder
+    """
+    with open(path) as f:
+        return [(entry["t"], entry["topic"], entry["payload"]) for entry in map(json.loads, f) if entry]
+
+
+def syntheticStream(machineIds, amount, rate, bounds, seed=0):
+    """Random position updates of the given machines like a planning table sends them
+
+    Args:
+        machineIds (list): gids of the machines
+        amount (int): number of messages
+        rate (float): messages per second
+        bounds (tuple): xmin, ymin, xmax, ymax of the positions
+        seed (int, optional): seed of the random positions. Defaults to 0.
+
+    Returns:
+        list: (time, topic, payload)
+    """
+    rng = np.random.default_rng(seed)
+    messages = []
+    for i in range(amount):
+        gid = machineIds[rng.integers(len(machineIds))]
+        x = rng.uniform(bounds[0], bounds[2])
+        y = rng.uniform(bounds[1], bounds[3])
+        messages.append((i / rate, f"EDF/BP/machines/{gid}/pos", json.dumps({"x": x, "y": y})))
+    return messages
+
+
+class Replayer():
+    """Publishes recorded messages with their original timing, sped up by speed
+
+    Args:
+        messages (list): (time, topic, payload) from loadRecording or syntheticStream
+        publish (function): called with topic and payload, e.g. LocalBroker.publish or the publish of a paho client
+        speed (float, optional): factor on the original rate. Defaults to 1.0.
+    """
+
+    def __init__(self, messages, publish, speed=1.0):
+        self.messages = messages
+        self.publish = publish
+        self.speed = speed
+        self.sent = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self):
+        start = perf_counter()
+        for t, topic, payload in self.messages:
+            if self._stop.is_set():
+                break
+            delay = t / self.speed - (perf_counter() - start)
+            if delay > 0:
+                sleep(delay)
+            self.publish(topic, payload)
+            self.sent += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="replay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def done(self):
+        return self._thread is not None and not self._thread.is_alive()
+
+
+def report(inbox, profiler, sent):
+    """Latency from arrival to application and message counts of a replay"""
+    stats = inbox.stats()
+    latency = profiler.summary().get("mqtt/applied")
+    lines = [f"sent {sent}, received {stats['received']}, coalesced {stats['coalesced']}, dropped {stats['dropped']}, not applied {stats['waiting']}"]
+    if latency:
+        lines.append(f"applied {latency['count']} updates, latency mean {latency['mean_ms']:.2f} ms, p90 {latency['p90_ms']:.2f} ms, p99 {latency['p99_ms']:.2f} ms, max {latency['max_ms']:.2f} ms")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Records EDF/BP/# streams and replays them into the live pipeline without a network.")
+    parser.add_argument("--record", type=str, help="Record the stream of --broker into this file until Ctrl+C.")
+    parser.add_argument("--broker", type=str, default="broker.emqx.io", help="Broker used for recording and for --publish.")
+    parser.add_argument("--replay", type=str, help="Recording to replay, without it a synthetic stream is used.")
+    parser.add_argument("--publish", action="store_true", help="Publish the replay to --broker instead of the headless load test.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Factor on the rate of the recording.")
+    parser.add_argument("--rate", type=float, default=200.0, help="Messages per second of the synthetic stream.")
+    parser.add_argument("--messages", type=int, default=2000, help="Number of messages of the synthetic stream.")
+    parser.add_argument("--machines", type=int, default=20, help="Machines of the synthetic layout.")
+    parser.add_argument("--fps", type=float, default=60.0, help="Frames per second of the headless render loop draining the inbox.")
+    args = parser.parse_args()
+
+    if args.record:
+        from paho.mqtt import client as mqtt
+        recorder = Recorder(args.record)
+        client = mqtt.Client(client_id="factorySimRecorder")
+        client.on_connect = lambda client, userdata, flags, rc: client.subscribe("EDF/BP/#")
+        client.on_message = recorder.on_message
+        client.connect(args.broker, 1883)
+        try:
+            client.loop_forever()
+        except KeyboardInterrupt:
+            pass
+        recorder.close()
+        print(f"Recorded {recorder.count} messages to {args.record}")
+        return
+
+    from factorySim.factorySimClass import FactorySim
+    from factorySim.evaluation import EvaluationService
+    import factorySim.baseConfigs as baseConfigs
+
+    #Synthetic layout, the same as the scaling benchmark uses
+    factory = FactorySim(None, factoryConfig=baseConfigs.SMALLSQUARE, randomPos=False, createMachines=True, randSeed=0, verboseOutput=0)
+    factory.machine_dict, factory.wall_dict = factory.creator.create_scaled_factory(args.machines)
+    factory.FACTORYDIMENSIONS = (factory.creator.factoryWidth, factory.creator.factoryHeight)
+    factory.dfMF = factory.creator.cleanMaterialFLow(factory.creator.createRandomMaterialFlow())
+    factory.evaluate()
+
+    if args.replay:
+        messages = loadRecording(args.replay)
+    else:
+        messages = syntheticStream(list(factory.machine_dict), args.messages, args.rate, factory.creator.bb.bounds)
+
+    if args.publish:
+        from paho.mqtt import client as mqtt
+        client = mqtt.Client(client_id="factorySimReplayer")
+        client.connect(args.broker, 1883)
+        client.loop_start()
+        Replayer(messages, client.publish, args.speed).run()
+        client.loop_stop()
+        return
+
+    #Headless version of factorySimLive.process_mqtt: drain, apply positions, fast KPIs, one background evaluation per frame
+    inbox = MQTTInbox()
+    profiler = Profiler(enabled=True)
+    client = LocalClient(LOCAL_BROKER, client_id="factorySimLive")
+    client.on_message = lambda client, userdata, msg: inbox.put(msg.topic, msg.payload)
+    client.connect()
+    client.subscribe("EDF/BP/#")
+    client.loop_start()
+    service = EvaluationService()
+    replayer = Replayer(messages, LOCAL_BROKER.publish, args.speed)
+    replayer.start()
+
+    frameTime = 1 / args.fps
+    while not replayer.done or client.pending() or len(inbox) > 0:
+        frameStart = perf_counter()
+        layoutChanged = False
+        for topic, payload, received in inbox.drain():
+            if topic.endswith("/pos"):
+                gid = topic.split("/")[3]
+                position = json.loads(payload)
+                if gid in factory.machine_dict and "x" in position and "y" in position:
+                    factory.machine_dict[gid].translate_Item(position["x"], position["y"])
+                    layoutChanged = True
+                    profiler.record("mqtt/applied", received, perf_counter())
+        if layoutChanged:
+            with profiler.span("frame/evaluateFast"):
+                factory.evaluateFast()
+            service.submit(factory)
+        profiler.record("frame", frameStart, perf_counter())
+        sleep(max(0.0, frameTime - (perf_counter() - frameStart)))
+
+    client.loop_stop()
+    service.close()
+    print(report(inbox, profiler, replayer.sent))
+    print(f"background evaluations cancelled {service.cancelledCount}, snapshots replaced while waiting {service.droppedCount}")
+    print(profiler)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import gc
+import json
+import os
+import threading
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+
+
+#Histogram buckets in microseconds, powers of two from 1 µs to about 17 min
+BUCKETS = 2.0 ** np.arange(31)
+
+
+class _NullSpan():
+    """Context manager doing nothing, returned while profiling is disabled"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span():
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, self.start, perf_counter())
+        return False
+
+
+class Profiler():
+    """Collects named spans of the hot path into histograms and an optional event list for Chrome traces.
+
+    While disabled, span() returns a shared no-op context manager and lap() returns immediately,
+    so instrumentation can stay in the code.
+
+    Args:
+        enabled (bool, optional): collect spans. Defaults to False.
+        echo (bool, optional): additionally print every span when it ends. Defaults to False.
+        maxEvents (int, optional): number of single spans kept for the Chrome trace, histograms are not limited. Defaults to 100000.
+    """
+
+    def __init__(self, enabled=False, echo=False, maxEvents=100000):
+        self.enabled = enabled
+        self.echo = echo
+        self.maxEvents = maxEvents
+        self.reset()
+
+    def reset(self):
+        self.stats = {}
+        self.events = []
+        self.droppedEvents = 0
+        self.timezero = perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span(self, name):
+        """Context manager measuring the enclosed block as span name"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def start(self):
+        """Sets the start of the next lap in the current thread"""
+        if self.enabled:
+            self._local.mark = perf_counter()
+
+    def lap(self, name):
+        """Records the time since the last lap or start in the current thread as span name"""
+        if not self.enabled:
+            return
+        now = perf_counter()
+        self.record(name, getattr(self._local, "mark", now), now)
+        self._local.mark = now
+
+    def record(self, name, start, end):
+        """Records a span measured with perf_counter outside of span() or lap()"""
+        if not self.enabled:
+            return
+        duration = end - start
+        with self._lock:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = {"count": 0, "total": 0.0, "min": float("inf"), "max": 0.0, "histogram": np.zeros(len(BUCKETS) + 1, dtype=np.int64)}
+            stat["count"] += 1
+            stat["total"] += duration
+            stat["min"] = min(stat["min"], duration)
+            stat["max"] = max(stat["max"], duration)
+            stat["histogram"][np.searchsorted(BUCKETS, duration * 1e6)] += 1
+            if len(self.events) < self.maxEvents:
+                self.events.append((name, start, duration, threading.get_ident()))
+            else:
+                self.droppedEvents += 1
+        if self.echo:
+            print(f"{duration * 1000:8.2f} ms - {name}")
+
+    def summary(self):
+        """Returns:
+            dict: span name -> count, total, mean, min, max, p50, p90 and p99 in ms together with the histogram.
+            Percentiles are upper bounds of the histogram bucket they fall into.
+        """
+        with self._lock:
+            result = {}
+            for name, stat in self.stats.items():
+                cumulative = np.cumsum(stat["histogram"])
+                percentiles = {}
+                for p in (50, 90, 99):
+                    index = int(np.searchsorted(cumulative, stat["count"] * p / 100))
+                    percentiles[f"p{p}_ms"] = min(float(BUCKETS[min(index, len(BUCKETS) - 1)]) / 1000, stat["max"] * 1000)
+                result[name] = {"count": stat["count"],
+                                "total_ms": stat["total"] * 1000,
+                                "mean_ms": stat["total"] * 1000 / stat["count"],
+                                "min_ms": stat["min"] * 1000,
+                                "max_ms": stat["max"] * 1000,
+                                **percentiles,
+                                "histogram_us": {f"<={int(BUCKETS[i])}" if i < len(BUCKETS) else f">{int(BUCKETS[-1])}": int(n)
+                                                 for i, n in enumerate(stat["histogram"]) if n > 0}}
+            return result
+
+    def exportJSON(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def exportChromeTrace(self, path):
+        """Writes all kept spans in the Chrome trace event format, to be opened in chrome://tracing or Perfetto"""
+        pid = os.getpid()
+        with self._lock:
+            traceEvents = [{"name": name, "cat": name.split("/")[0], "ph": "X", "pid": pid, "tid": tid,
+                            "ts": (start - self.timezero) * 1e6, "dur": duration * 1e6}
+                           for name, start, duration, tid in self.events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": traceEvents, "displayTimeUnit": "ms", "otherData": {"droppedEvents": self.droppedEvents}}, f)
+
+    def __str__(self):
+        lines = [f"{'span':<40} {'count':>7} {'total ms':>10} {'mean ms':>9} {'p90 ms':>9} {'max ms':>9}"]
+        for name, stat in sorted(self.summary().items(), key=lambda item: item[1]["total_ms"], reverse=True):
+            lines.append(f"{name:<40} {stat['count']:7d} {stat['total_ms']:10.2f} {stat['mean_ms']:9.2f} {stat['p90_ms']:9.2f} {stat['max_ms']:9.2f}")
+        return "\n".join(lines)
+
+    #Locks and thread locals can not be copied or pickled, a copy gets new ones
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+
+def currentRSS():
+    """Resident memory of this process in MB, the peak value where the current one is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def countObjects(types):
+    """Counts live instances of the given types.
+    Objects like shapely geometries or cairo surfaces are not tracked by the garbage collector, so the referents of all tracked objects are searched as well.
+
+    Args:
+        types (dict): name -> type or tuple of types
+
+    Returns:
+        dict: name -> number of distinct instances
+    """
+    seen = {name: set() for name in types}
+    for obj in gc.get_objects():
+        for candidate in [obj] + gc.get_referents(obj):
+            for name, kind in types.items():
+                if isinstance(candidate, kind):
+                    seen[name].add(id(candidate))
+    return {name: len(ids) for name, ids in seen.items()}
+
+
+class MemoryTracker():
+    """Reports memory use every interval calls of update(), for finding leaks in long runs.
+
+    Starts tracemalloc, so it slows down allocations and should only be enabled while looking for leaks.
+
+    Args:
+        interval (int): number of update() calls between two reports
+        countTypes (dict, optional): name -> type of objects to count in every report. Defaults to None.
+        topStats (int, optional): number of source lines with the largest growth since the last report. Defaults to 10.
+    """
+
+    def __init__(self, interval, countTypes=None, topStats=10):
+        self.interval = interval
+        self.countTypes = countTypes or {}
+        self.topStats = topStats
+        self.calls = 0
+        self.lastSnapshot = None
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def update(self):
+        """Returns:
+            dict: report on every interval-th call, otherwise None
+        """
+        self.calls += 1
+        if self.calls % self.interval != 0:
+            return None
+
+        traced, tracedPeak = tracemalloc.get_traced_memory()
+        report = {"calls": self.calls,
+                  "rss_mb": currentRSS(),
+                  "traced_mb": traced / 2**20,
+                  "traced_peak_mb": tracedPeak / 2**20,
+                  **countObjects(self.countTypes)}
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        if self.lastSnapshot is not None:
+            stats = snapshot.compare_to(self.lastSnapshot, "lineno")
+            report["growth"] = [str(stat) for stat in stats[:self.topStats] if stat.size_diff > 0]
+        self.lastSnapshot = snapshot
+        tracemalloc.reset_peak()
+        return report
+
+
+if __name__ == "__main__":
+    from time import sleep
+
+    profiler = Profiler(enabled=True, echo=True)
+    profiler.start()
+    for i in range(5):
+        with profiler.span("demo/sleep"):
+            sleep(0.001 * i)
+        profiler.lap("demo/lap")
+    print(profiler)
+    disabled = Profiler()
+    assert disabled.span("demo/sleep") is _NULL_SPAN and not disabled.stats
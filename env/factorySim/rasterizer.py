@@ -0,0 +1,303 @@
+import numpy as np
+import networkx as nx
+
+
+#Grey values of the observation layers, the same as the colors draw_obs_layer_A and draw_obs_layer_B use
+WHITE = 1.0
+WALL = 0.2
+PATH = 0.3
+MACHINE = 0.4
+MATERIALFLOW = 0.6
+FARFROMPATH = 0.8
+HIGHLIGHT = 0.9
+COLLISION = 1.0
+
+#Chunk of segments measured against all pixels at once, limits the size of the distance arrays
+SEGMENT_CHUNK = 128
+
+
+def _grey(value):
+    return np.uint8(round(value * 255))
+
+
+class Canvas():
+    """Single channel image filled and stroked with NumPy, a pixel is covered when its center is covered.
+    This is what cairo does without antialiasing.
+
+    Args:
+        width (int): width in pixels
+        height (int): height in pixels
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = np.empty((height, width), dtype=np.uint8)
+        self._xs = np.arange(width) + 0.5
+        self._ys = np.arange(height) + 0.5
+        self.scale = 1.0
+        self.origin = np.zeros(2)
+
+    def setTransform(self, scale, origin):
+        """Factory coordinates are transformed to pixels by (coords - origin) * scale"""
+        self.scale = scale
+        self.origin = np.asarray(origin, dtype=np.float64)
+
+    def toDevice(self, coords):
+        return (np.asarray(coords, dtype=np.float64)[:, :2] - self.origin) * self.scale
+
+    def paint(self, value):
+        self.pixels.fill(_grey(value))
+
+    def _window(self, points, margin=0.0):
+        #Pixel rows and columns touched by points, None if they are outside of the image
+        x0 = max(int(np.floor(points[:, 0].min() - margin)), 0)
+        x1 = min(int(np.ceil(points[:, 0].max() + margin)) + 1, self.width)
+        y0 = max(int(np.floor(points[:, 1].min() - margin)), 0)
+        y1 = min(int(np.ceil(points[:, 1].max() + margin)) + 1, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, x1, y0, y1
+
+    def fillPath(self, rings, value):
+        """Fills closed rings given in factory coordinates as a single path with the even-odd rule.
+        For the simple, non overlapping rings from shapely this is the same as the nonzero rule.
+
+        Args:
+            rings (list): arrays of shape (n, 2), first and last point may be the same
+            value (float): grey value between 0 and 1
+        """
+        edges = []
+        for ring in rings:
+            points = self.toDevice(ring)
+            if len(points) < 3:
+                continue
+            edges.append(np.stack([points, np.roll(points, -1, axis=0)], axis=1))
+        if not edges:
+            return
+        edges = np.concatenate(edges)
+        window = self._window(edges.reshape(-1, 2))
+        if window is None:
+            return
+        x0, x1, y0, y1 = window
+        xs = self._xs[x0:x1]
+        ys = self._ys[y0:y1, None]
+
+        ax, ay = edges[:, 0, 0], edges[:, 0, 1]
+        bx, by = edges[:, 1, 0], edges[:, 1, 1]
+        #Scanline crossings of every edge with every pixel row, edges not crossing a row are moved to infinity
+        crosses = (ay <= ys) != (by <= ys)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossingX = np.where(crosses, ax + (ys - ay) * (bx - ax) / (by - ay), np.inf)
+        inside = np.count_nonzero(crossingX[:, :, None] < xs, axis=1) % 2 == 1
+        self.pixels[y0:y1, x0:x1][inside] = _grey(value)
+
+    def strokePolylines(self, lines, width, value, dash=None):
+        """Strokes open polylines given in factory coordinates with round joins and caps
+
+        Args:
+            lines (list): arrays of shape (n, 2)
+            width (float): line width in pixels
+            value (float): grey value between 0 and 1
+            dash (tuple, optional): length on and off in pixels, restarting with every line. Defaults to None.
+        """
+        starts, ends, offsets = [], [], []
+        for line in lines:
+            points = self.toDevice(line)
+            if len(points) == 1:
+                points = np.repeat(points, 2, axis=0)
+            lengths = np.hypot(*(points[1:] - points[:-1]).T)
+            starts.append(points[:-1])
+            ends.append(points[1:])
+            offsets.append(np.concatenate([[0.0], np.cumsum(lengths)[:-1]]))
+        if not starts:
+            return
+        starts, ends, offsets = np.concatenate(starts), np.concatenate(ends), np.concatenate(offsets)
+        window = self._window(np.concatenate([starts, ends]), margin=width / 2)
+        if window is None:
+            return
+        x0, x1, y0, y1 = window
+        px = self._xs[None, x0:x1, None]
+        py = self._ys[y0:y1, None, None]
+        radius2 = (width / 2) ** 2
+
+        covered = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+        for i in range(0, len(starts), SEGMENT_CHUNK):
+            a, b, offset = starts[i:i + SEGMENT_CHUNK], ends[i:i + SEGMENT_CHUNK], offsets[i:i + SEGMENT_CHUNK]
+            vx, vy = (b - a).T
+            length2 = vx * vx + vy * vy
+            dx, dy = px - a[:, 0], py - a[:, 1]
+            #Position of the closest point on every segment, 0 at its start and 1 at its end
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = np.clip(np.where(length2 > 0, (dx * vx + dy * vy) / length2, 0.0), 0.0, 1.0)
+            hit = (dx - t * vx) ** 2 + (dy - t * vy) ** 2 <= radius2
+            if dash is not None:
+                along = offset + t * np.sqrt(length2)
+                hit &= along % (dash[0] + dash[1]) < dash[0]
+            covered |= hit.any(axis=2)
+        self.pixels[y0:y1, x0:x1][covered] = _grey(value)
+
+
+def _polygonRings(geometry):
+    return [np.asarray(poly.exterior.coords) for poly in geometry.geoms]
+
+
+def draw_obs_layer_A(canvas, factory, highlight=None):
+    """Walls, machines and collisions, the same layer as rendering.draw_obs_layer_A"""
+    canvas.paint(WHITE)
+
+    for wall in (factory.wall_dict or {}).values():
+        for poly in wall.poly.geoms:
+            canvas.fillPath([np.asarray(poly.exterior.coords)], WALL)
+            for loop in poly.interiors:
+                canvas.fillPath([np.asarray(loop.coords)], WHITE)
+
+    _drawMachines(canvas, factory, highlight)
+
+    for collisions in (factory.machineCollisionList, factory.wallCollisionList, factory.outsiderList):
+        for collision in collisions or []:
+            canvas.fillPath(_polygonRings(collision), COLLISION)
+
+    return canvas
+
+
+def draw_obs_layer_B(canvas, factory, highlight=None):
+    """Paths, machines and material flow, the same layer as rendering.draw_obs_layer_B.
+    The small arcs cairo adds at path corners lie inside the path width and are left out."""
+    canvas.paint(WHITE)
+
+    if factory.fullPathGraph and factory.reducedPathGraph:
+        pos = nx.get_node_attributes(factory.fullPathGraph, 'pos')
+        twoway = []
+        for u, v, data in factory.reducedPathGraph.edges(data=True):
+            line = [np.array([pos[node] for node in data["nodelist"]])]
+            if data.get("isMachineConnection", False):
+                canvas.strokePolylines(line, 2.0, PATH)
+                continue
+            canvas.strokePolylines(line, data['pathwidth'] * canvas.scale, PATH)
+            if data['pathtype'] == "twoway":
+                twoway.extend(line)
+        canvas.strokePolylines(twoway, 1.0, WHITE, dash=(10.0, 10.0))
+
+    _drawMachines(canvas, factory, highlight)
+
+    if factory.dfMF is not None:
+        for row in factory.dfMF.itertuples():
+            try:
+                source = factory.machine_dict[row.source].center
+                target = factory.machine_dict[row.target].center
+            except KeyError:
+                print(f"Error in Material Flow Drawing - Machine {row.source} or {row.target} not defined")
+                continue
+            canvas.strokePolylines([np.array([[source.x, source.y], [target.x, target.y]])], row.intensity_sum_norm * 3.0, MATERIALFLOW)
+
+    return canvas
+
+
+def _drawMachines(canvas, factory, highlight):
+    for index, machine in enumerate((factory.machine_dict or {}).values()):
+        rings = _polygonRings(machine.poly)
+        if index == highlight or machine.gid == highlight:
+            canvas.fillPath(rings, HIGHLIGHT)
+        elif machine.gid in factory.MachinesFarFromPath:
+            canvas.strokePolylines(rings, 5.0, FARFROMPATH)
+            canvas.fillPath(rings, FARFROMPATH)
+        else:
+            canvas.fillPath(rings, MACHINE)
+
+
+class NumpyObservationRenderer():
+    """Observation backend rasterizing both layers with NumPy instead of cairo.
+    Pixels are not antialiased, edges differ slightly from the cairo backends.
+
+    Args:
+        width (int): width of the observation in pixels
+        height (int): height of the observation in pixels
+    """
+
+    def __init__(self, width, height):
+        #The canvas has height rows of width pixels, observations are indexed (width, height), which only agree for square images
+        if width != height:
+            raise ValueError(f"NumpyObservationRenderer needs a square observation, got {width}x{height}")
+        self.width = width
+        self.height = height
+        self.canvas = Canvas(width, height)
+
+    def setup(self, factory):
+        """Uses the transformation provideCairoDrawingData would set for this factory"""
+        scale = factory.creator.suggest_factory_view_scale(self.width, self.height)
+        self.canvas.setTransform(scale, factory.creator.bb.bounds[0:2])
+
+    def render(self, factory, out, highlight=None):
+        """Writes layer A into out[..., 0] and layer B into out[..., 1]
+
+        Args:
+            factory (FactorySim): evaluated factory
+            out (np.ndarray): uint8 array of shape (width, height, 2) with width == height
+            highlight (str, optional): gid of the highlighted machine. Defaults to None.
+        """
+        for channel, drawLayer in enumerate((draw_obs_layer_A, draw_obs_layer_B)):
+            drawLayer(self.canvas, factory, highlight=highlight)
+            out[..., channel] = self.canvas.pixels
+        return out
+
+
+def _neighbourhoodRange(image):
+    #Smallest and largest value of the 3x3 neighbourhood of every pixel
+    padded = np.pad(image, 1, mode="edge")
+    h, w = image.shape
+    shifted = np.stack([padded[dy:dy + h, dx:dx + w] for dy in range(3) for dx in range(3)])
+    return shifted.min(axis=0), shifted.max(axis=0)
+
+
+if __name__ == "__main__":
+    #Compares the rasterizer pixel by pixel with the default "cairo" observation backend of FactorySimEnv
+    from factorySim.factorySimClass import FactorySim
+    from factorySim.rendering import draw_obs_layer_A as cairo_layer_A, draw_obs_layer_B as cairo_layer_B
+    import factorySim.baseConfigs as baseConfigs
+
+    #Cairo antialiases edges into intermediate greys the rasterizer never produces, so pixels are split into
+    #interior pixels, whose 3x3 neighbourhood in the cairo image is uniform, and edge pixels.
+    #Interior pixels have to match, a missing machine or path shows up there.
+    #Edge pixels only have to lie within the greys of their cairo neighbourhood. Lines thinner than a pixel,
+    #like the dashes of two way paths, are blended on all their pixels, so a few of them may fall outside.
+    INTERIOR_TOLERANCE = 0.001
+    EDGE_TOLERANCE = 0.01
+
+    size = 84
+    for amountMachines in (5, 20, 50):
+        factory = FactorySim(None,
+            factoryConfig=baseConfigs.SMALLSQUARE,
+            randomPos=False,
+            createMachines=True,
+            randSeed=amountMachines,
+            verboseOutput=0)
+        factory.machine_dict, factory.wall_dict = factory.creator.create_scaled_factory(amountMachines)
+        factory.FACTORYDIMENSIONS = (factory.creator.factoryWidth, factory.creator.factoryHeight)
+        factory.dfMF = factory.creator.cleanMaterialFLow(factory.creator.createRandomMaterialFlow())
+        factory.evaluate()
+        highlight = next(iter(factory.machine_dict))
+
+        #Same drawing as FactorySimEnv._get_obs without an obsRenderer
+        surface, ctx = factory.provideCairoDrawingData(size, size)
+        pixels = np.ndarray(shape=(size, size, 4), dtype=np.uint8, buffer=surface.get_data())
+        expected = np.empty((size, size, 2), dtype=np.uint8)
+        for channel, drawLayer in enumerate((cairo_layer_A, cairo_layer_B)):
+            drawLayer(ctx, factory, highlight=highlight)
+            expected[..., channel] = pixels[..., 2]
+
+        rasterizer = NumpyObservationRenderer(size, size)
+        rasterizer.setup(factory)
+        result = rasterizer.render(factory, np.empty((size, size, 2), dtype=np.uint8), highlight=highlight)
+
+        for channel in range(2):
+            reference = expected[..., channel].astype(np.int16)
+            values = result[..., channel].astype(np.int16)
+            low, high = _neighbourhoodRange(reference)
+            interior = low == high
+            #Values may differ by one from rounding the greys to 8 bit
+            interiorMismatch = np.count_nonzero(interior & (np.abs(values - reference) > 1)) / size**2
+            edgeMismatch = np.count_nonzero(~interior & ((values < low - 1) | (values > high + 1))) / size**2
+            print(f"{amountMachines:3d} machines, layer {'AB'[channel]}: {interiorMismatch:.2%} of the pixels differ inside shapes, {edgeMismatch:.2%} at edges")
+            assert interiorMismatch <= INTERIOR_TOLERANCE, f"rasterizer differs from cairo inside shapes of layer {'AB'[channel]}"
+            assert edgeMismatch <= EDGE_TOLERANCE, f"rasterizer differs from cairo at edges of layer {'AB'[channel]}"
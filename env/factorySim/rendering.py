@@ -213,32 +213,37 @@ def draw_route_lines(ctx, route_lines):
     ctx.stroke()
     return ctx
 
+#------------------------------------------------------------------------------------------------------------
+def draw_walls(ctx, wall_dict, darkmode = True):
+    ctx.set_fill_rule(cairo.FillRule.EVEN_ODD)
+    for wall in wall_dict.values():
+        #draw all walls
+        for  poly in wall.poly.geoms:
+            ctx.set_source_rgba(0.2, 0.2, 0.2, 1.0)
+            ctx.move_to(*poly.exterior.coords[0])
+            for point in poly.exterior.coords[1:]:  
+                ctx.line_to(point[0], point[1])
+            ctx.close_path()
+            ctx.fill()
+        #draw all holes
+            if darkmode:
+                ctx.set_source_rgba(0.0, 0.0, 0.0)
+            else:
+                ctx.set_source_rgb(1.0, 1.0, 1.0)
+            for loop in poly.interiors:
+                ctx.move_to(*loop.coords[0])
+                for point in loop.coords[1:]:
+                    ctx.line_to(point[0], point[1])
+                ctx.close_path()
+                ctx.fill()
+    return ctx
+
 #------------------------------------------------------------------------------------------------------------
 def drawFactory(ctx, factory, materialflow_file=None, drawColors = True, drawNames = True, darkmode = True, drawWalls = True, drawMachineCenter = False, drawOrigin = False, highlight = None, isObs = False):   
     
     #Walls
     if factory.wall_dict and drawWalls:
-        ctx.set_fill_rule(cairo.FillRule.EVEN_ODD)
-        for wall in factory.wall_dict.values():
-            #draw all walls
-            for  poly in wall.poly.geoms:
-                ctx.set_source_rgba(0.2, 0.2, 0.2, 1.0)
-                ctx.move_to(*poly.exterior.coords[0])
-                for point in poly.exterior.coords[1:]:  
-                    ctx.line_to(point[0], point[1])
-                ctx.close_path()
-                ctx.fill()
-            #draw all holes
-                if darkmode:
-                    ctx.set_source_rgba(0.0, 0.0, 0.0)
-                else:
-                    ctx.set_source_rgb(1.0, 1.0, 1.0)
-                for loop in poly.interiors:
-                    ctx.move_to(*loop.coords[0])
-                    for point in loop.coords[1:]:
-                        ctx.line_to(point[0], point[1])
-                    ctx.close_path()
-                    ctx.fill()
+        draw_walls(ctx, factory.wall_dict, darkmode)
                         
     #draw machine positions
     if factory.machine_dict:
@@ -246,7 +251,7 @@ def drawFactory(ctx, factory, materialflow_file=None, drawColors = True, drawNam
         ctx.set_line_width(ctx.device_to_user_distance(5, 5)[0])
         ctx.set_dash([])
         for index, machine in enumerate(factory.machine_dict.values()):
-            for poly in machine.poly.geoms:
+            for polyIndex, poly in enumerate(machine.poly.geoms):
                 ctx.move_to(*poly.exterior.coords[0])
                 for point in poly.exterior.coords[1:]: 
                     ctx.line_to(point[0], point[1])
@@ -287,8 +292,8 @@ def drawFactory(ctx, factory, materialflow_file=None, drawColors = True, drawNam
                     ctx.set_source_rgba(1.0, 1.0, 1.0, 1.0)
                     ctx.set_font_size(ctx.device_to_user_distance(14, 14)[0])
                     (x, y, width, height, dx, dy) = ctx.text_extents(str(machine.name))
-                    point = polylabel(poly, tolerance=1000)
-                    ctx.move_to(point.x - width/2, point.y + height/2) 
+                    labelX, labelY = machine.labelAnchors()[polyIndex]
+                    ctx.move_to(labelX - width/2, labelY + height/2) 
                     ctx.show_text(str(machine.name))
 
         #Machine Centers
@@ -449,3 +454,105 @@ def draw_obs_layer_B(ctx, factory,  highlight=None):
     drawFactory(ctx, factory, factory.dfMF, drawWalls=False, drawColors = False, drawNames=False, highlight=highlight, isObs=True)
     
     return ctx
+
+#------------------------------------------------------------------------------------------------------------
+class _GreyContext():
+    """Wraps the context of an A8 surface. Colors set on it are written as their red value into the alpha channel,
+    which is the value draw_obs_layer_A and draw_obs_layer_B leave in the red channel of an ARGB surface.
+    All colors of the observation layers are opaque, so their alpha is ignored."""
+
+    def __init__(self, ctx):
+        self._ctx = ctx
+        ctx.set_operator(cairo.OPERATOR_SOURCE)
+
+    def set_source_rgb(self, r, g, b):
+        self._ctx.set_source_rgba(0.0, 0.0, 0.0, r)
+
+    def set_source_rgba(self, r, g, b, a=1.0):
+        self._ctx.set_source_rgba(0.0, 0.0, 0.0, r)
+
+    def __getattr__(self, name):
+        return getattr(self._ctx, name)
+
+#------------------------------------------------------------------------------------------------------------
+def draw_obs_layers(ctxA, ctxB, factory, highlight=None):
+    """Draws both observation layers into the contexts of two A8 surfaces in a single pass over the machines.
+    The alpha of the surfaces matches the red channel of draw_obs_layer_A and draw_obs_layer_B."""
+    greyA = _GreyContext(ctxA)
+    greyB = _GreyContext(ctxB)
+    for grey in (greyA, greyB):
+        grey.set_source_rgb(1.0, 1.0, 1.0)
+        grey.paint()
+
+    if factory.wall_dict:
+        draw_walls(greyA, factory.wall_dict, darkmode=False)
+    draw_detail_paths(greyB, factory.fullPathGraph, factory.reducedPathGraph)
+
+    #Machines are traced once, the path is copied into the second context
+    if factory.machine_dict:
+        for grey in (greyA, greyB):
+            grey.set_fill_rule(cairo.FillRule.WINDING)
+            grey.set_line_width(grey.device_to_user_distance(5, 5)[0])
+            grey.set_dash([])
+        for index, machine in enumerate(factory.machine_dict.values()):
+            for poly in machine.poly.geoms:
+                ctxA.move_to(*poly.exterior.coords[0])
+                for point in poly.exterior.coords[1:]:
+                    ctxA.line_to(point[0], point[1])
+                ctxA.close_path()
+                ctxB.append_path(ctxA.copy_path())
+                for grey in (greyA, greyB):
+                    #highlighted machine
+                    if(index == highlight or machine.gid == highlight):
+                        grey.set_source_rgb(0.9, 0.9, 0.9)
+                    #make machines far from path transparent
+                    elif machine.gid in factory.MachinesFarFromPath:
+                        grey.set_source_rgb(0.8, 0.8, 0.8)
+                        grey.stroke_preserve()
+                    else:
+                        grey.set_source_rgb(0.4, 0.4, 0.4)
+                    grey.fill()
+
+    drawMaterialFlow(greyB, factory.machine_dict, factory.dfMF, drawColors=False, isObs=True)
+    drawCollisions(greyA, factory.machineCollisionList, factory.wallCollisionList, outsiderList=factory.outsiderList)
+
+    return ctxA, ctxB
+
+#------------------------------------------------------------------------------------------------------------
+class A8ObservationRenderer():
+    """Observation backend drawing both layers in one pass into two A8 surfaces
+
+    Args:
+        width (int): width of the observation in pixels
+        height (int): height of the observation in pixels
+    """
+
+    def __init__(self, width, height):
+        #Surfaces have height rows of width pixels, observations are indexed (width, height), which only agree for square images
+        if width != height:
+            raise ValueError(f"A8ObservationRenderer needs a square observation, got {width}x{height}")
+        self.width = width
+        self.height = height
+        self.surfaceA, self.ctxA = None, None
+        self.surfaceB, self.ctxB = None, None
+
+    def setup(self, factory):
+        """Sets the transformation for a new factory, the surfaces are kept"""
+        self.surfaceA, self.ctxA = factory.provideCairoDrawingData(self.width, self.height, surface=self.surfaceA, ctx=self.ctxA, surfaceFormat=cairo.FORMAT_A8)
+        self.surfaceB, self.ctxB = factory.provideCairoDrawingData(self.width, self.height, surface=self.surfaceB, ctx=self.ctxB, surfaceFormat=cairo.FORMAT_A8)
+
+    def render(self, factory, out, highlight=None):
+        """Writes layer A into out[..., 0] and layer B into out[..., 1]
+
+        Args:
+            factory (FactorySim): evaluated factory
+            out (np.ndarray): uint8 array of shape (width, height, 2) with width == height
+            highlight (str, optional): gid of the highlighted machine. Defaults to None.
+        """
+        draw_obs_layers(self.ctxA, self.ctxB, factory, highlight=highlight)
+        for channel, surface in enumerate((self.surfaceA, self.surfaceB)):
+            surface.flush()
+            #Rows of A8 surfaces are padded to the stride
+            plane = np.ndarray(shape=(self.height, self.width), dtype=np.uint8, buffer=surface.get_data(), strides=(surface.get_stride(), 1))
+            out[..., channel] = plane
+        return out
@@ -1,6 +1,4 @@
 #%%
-import time
-
 from shapely.geometry import Point, MultiPoint, MultiPolygon, MultiLineString, GeometryCollection, LineString
 from shapely.affinity import translate, rotate
 from shapely.strtree import STRtree
@@ -16,14 +14,17 @@ import networkx as nx
 from scipy.spatial import KDTree
 from math import dist
 
+from factorySim.profiling import Profiler
+
 DETAILPLOT = False
 
 class FactoryPath():
 
     fullPathGraph = None
     reducedPathGraph = None
-    TIMING = False
     PLOTTING = False
+    #Intermediate geometry of calculateAll, rebuilt by every call, so copies of a path finder can leave it out
+    INTERMEDIATE_RESULTS = ("route_lines", "lines_touching_machines", "lines_to_machines", "hitpoints", "hit_tree")
 
     def __init__(self, boundarySpacing=150, minDeadEndLength=2000, minPathWidth=1000, maxPathWidth=2500, minTwoWayPathWidth=2000, simplificationAngle=35):
 
@@ -35,11 +36,11 @@ class FactoryPath():
         self.simplificationAngle = simplificationAngle # Angle in degrees, used for support point calculation in simple path
         self.fullPathGraph = nx.Graph() # initialize the graph
         self.reducedPathGraph = nx.Graph()# initialize the graph
-
-    def timelog(self, text):
-        self.nextTime = time.perf_counter()
-        print(f"{text} {self.nextTime - self.startTime}")
-        self.startTime = self.nextTime
+        self.angleNodes = [] # Inner nodes of the reduced edges, in the order of nodeAngles
+        self.nodeAngles = {} # edge_angle, arcstart, arcend, gamma1 and gamma2 of angleNodes as arrays
+        self._wallContextKey = None # Walls do not move, so their derived geometry is reused between evaluations
+        self._wallContext = None
+        self.profiler = Profiler() # Replaced by the profiler of the factory, disabled by default
 
     def calculateAll(self, machine_dict, wall_dict, bb):
         #Check if we have enough machines to make a path
@@ -61,28 +62,28 @@ class FactoryPath():
             print("Error: No valid Polygon in Machine Dictionary")
             return None, None, None
 
-        walllist = [x.poly for x in wall_dict.values()]
-        union = unary_union(walllist)
-        if union.geom_type == "MultiPolygon":
-            walls = MultiPolygon(union)
-        elif union.geom_type == "Polygon":
-            walls = MultiPolygon([union])
-        elif union.geom_type == "GeometryCollection":
-            walls = multi.convex_hull
-        else:
-            print("Error: No valid Polygon in Wall Dictionary")
-            return None, None, None
-
         #Scale boundary spacing according to factory size
         bbox = bb.bounds
         scale = max((bbox[2]-bbox[0]),(bbox[3]-bbox[1])) / 30
         scale = 1
 
-        if self.TIMING:
-            self.startTime = time.perf_counter()
-            self.totalTime = self.startTime
+        wallContext = self.wallContext(wall_dict, scale)
+        if wallContext:
+            walllist, walls, outerRing, wallPoints = wallContext
+        else:
+            walllist = [x.poly for x in wall_dict.values()]
+            union = unary_union(walllist)
+            if union.geom_type == "GeometryCollection":
+                walls = multi.convex_hull
+            else:
+                print("Error: No valid Polygon in Wall Dictionary")
+                return None, None, None
+            outerRing = walls.convex_hull.buffer(100)- walls.convex_hull
+            wallPoints = None
+
+        self.profiler.start()
 
-        machinesAndwalls = unary_union(machinelist + walllist + [walls.convex_hull.buffer(100)- walls.convex_hull]) 
+        machinesAndwalls = unary_union(machinelist + walllist + [outerRing]) 
 
 
 
@@ -101,15 +102,17 @@ class FactoryPath():
 #   Create Voronoi -------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
         #Points around boundary
 
-        distances = np.arange(0,  walls.boundary.length, self.boundarySpacing * scale)
-        points = [walls.boundary.interpolate(distance) for distance in distances]
+        if wallPoints is None:
+            distances = np.arange(0,  walls.boundary.length, self.boundarySpacing * scale)
+            wallPoints = [walls.boundary.interpolate(distance) for distance in distances]
+        points = list(wallPoints)
 
         #Points on Machines
         distances = np.arange(0,  multi.boundary.length, self.boundarySpacing * scale)
         points.extend([multi.boundary.interpolate(distance) for distance in distances])
         bb_points = unary_union(points) 
 
-        if self.TIMING: self.timelog("Boundary generation")
+        self.profiler.lap("routing/Boundary generation")
 
         voronoiBase = GeometryCollection([walkableArea, bb_points])
         try:
@@ -118,7 +121,7 @@ class FactoryPath():
             print("Error: Could not create Voronoi Diagram")
             return None, None, None
 
-        if self.TIMING: self.timelog("Voronoi")
+        self.profiler.lap("routing/Voronoi")
 
         #TODO try STRTree Querry
 
@@ -151,7 +154,7 @@ class FactoryPath():
             print("Error: Voronoi Diagram is not a MultiLineString")
             return None, None, None
 
-        if self.TIMING: self.timelog("Find Routes")
+        self.profiler.lap("routing/Find Routes")
 
         if DETAILPLOT:
 
@@ -161,14 +164,14 @@ class FactoryPath():
             except:
                 print("Split Error")         
 
-            if self.TIMING: self.timelog("Split")
+            self.profiler.lap("routing/Split")
 
             #Remove Geometries that are inside machines
             for line in sresult.geoms:
                 if  not (processed_multi.covers(line) and (not processed_multi.disjoint(line) ) or processed_multi.crosses(line)):
                     self.lines_to_machines.append(line)
 
-            if self.TIMING: self.timelog("Line Filtering")
+            self.profiler.lap("routing/Line Filtering")
 
         #Simplify Lines
         self.route_lines = linemerge(self.route_lines)
@@ -236,7 +239,7 @@ class FactoryPath():
                     self.fullPathGraph.add_node(lastPoint_str, pos=lastPointTuple, pathwidth=lastPathWidth, routeIndex=index)
                     continue
 
-        if self.TIMING: self.timelog("Network generation")
+        self.profiler.lap("routing/Network generation")
 
 # Filter  Graph -------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
         # Cleans road network created with voronoi method by 
@@ -263,7 +266,7 @@ class FactoryPath():
         self.old_endpoints = [node for node, degree in self.fullPathGraph.degree() if degree == 1]
 
 
-        if self.TIMING: self.timelog("Network Filtering")
+        self.profiler.lap("routing/Network Filtering")
 
 # Connect Machines to Network  -------------------------------------------------------------------------------------------------------------------------------------------------- 
 
@@ -298,27 +301,22 @@ class FactoryPath():
         self.endpoints = [node for node, degree in self.fullPathGraph.degree() if degree == 1]
         self.crossroads = [node for node, degree in self.fullPathGraph.degree() if degree >= 3]
 
-        if self.TIMING: self.timelog("Machine Connection Calculation")
+        self.profiler.lap("routing/Machine Connection Calculation")
 
 # Prune unused dead ends  -------------------------------------------------------------------------------------------------------------------------------------------------- 
 
         if self.PLOTTING: self.inter_filteredGraph = self.fullPathGraph.copy()
 
-        for i in range(2):
-            #Endpoints that are machine connections should not be pruned
-            endpoints_to_prune = [endpoint for endpoint in self.endpoints if not self.fullPathGraph.nodes[endpoint].get("isMachineConnection",False)]
-
-            if endpoints_to_prune:
-                self.shortDeadEnds = self.pruneAlongPath(self.fullPathGraph, starts=endpoints_to_prune, ends=self.crossroads, min_length=3 * self.minDeadEndLength)
-                if self.shortDeadEnds: self.fullPathGraph.remove_nodes_from(self.shortDeadEnds)
+        #Endpoints that are machine connections should not be pruned
+        endpoints_to_prune = [endpoint for endpoint in self.endpoints if not self.fullPathGraph.nodes[endpoint].get("isMachineConnection",False)]
+        self.shortDeadEnds = self.pruneAlongPath(self.fullPathGraph, starts=endpoints_to_prune, keep=machine_dict.keys(), min_length=3 * self.minDeadEndLength)
 
-            
-            self.endpoints = [node for node, degree in self.fullPathGraph.degree() if degree == 1]
-            self.crossroads = [node for node, degree in self.fullPathGraph.degree() if degree >= 3]
-            # #Set isCrossroads attribute on cross road nodes
-            nx.set_node_attributes(self.fullPathGraph, dict.fromkeys(self.crossroads, True), 'isCrossroads')
+        self.endpoints = [node for node, degree in self.fullPathGraph.degree() if degree == 1]
+        self.crossroads = [node for node, degree in self.fullPathGraph.degree() if degree >= 3]
+        # #Set isCrossroads attribute on cross road nodes
+        nx.set_node_attributes(self.fullPathGraph, dict.fromkeys(self.crossroads, True), 'isCrossroads')
 
-        if self.TIMING: self.timelog("Dead End Pruning")
+        self.profiler.lap("routing/Dead End Pruning")
 
         
 
@@ -328,111 +326,50 @@ class FactoryPath():
 
         self.reducedPathGraph = nx.Graph()
 
-        visited = set() # Set to keep track of visited nodes.
-        tempPath = [] # List to keep track of visited nodes in current path.
-
         ep = self.endpoints
         cross = self.crossroads
         stoppers = set(ep + cross + self.old_endpoints)
 
         if ep: 
-            nodes_to_visit = [ep[0]]
+            chains = self.contractChains(self.fullPathGraph, stoppers, start=ep[0])
         elif cross:
-            nodes_to_visit = [cross[0]]
+            chains = self.contractChains(self.fullPathGraph, stoppers, start=cross[0])
         else:
-            nodes_to_visit = []
+            chains = []
 
-        maxpath = 0
-        minpath = float('inf')
-        totalweight = 0
-        currentInnerNode = None
+        for currentOuterNode, currentInnerNode, tempPath, totalweight, minpath, maxpath in chains:
+            tempPath = self.filterZigZag(tempPath, [pos[node] for node in tempPath], self.boundarySpacing * 5) 
 
-        #DFS Start
-        while(nodes_to_visit):
+            pathtype = "oneway"
+            if minpath > self.minTwoWayPathWidth: pathtype = "twoway"
 
-            currentOuterNode = nodes_to_visit.pop()
-            if currentOuterNode in visited:
-                continue
+            if "isMachineConnection" in self.fullPathGraph.nodes[currentOuterNode] or "isMachineConnection" in self.fullPathGraph.nodes[currentInnerNode]:
+                machineConnection = True
             else:
-                visited.add(currentOuterNode)
-
-            for outerNeighbor in self.fullPathGraph.neighbors(currentOuterNode):
-                if outerNeighbor in visited: continue
-
-                maxpath = 0
-                minpath = float('inf')
-                totalweight = 0
-
-                lastNode = currentOuterNode
-                currentInnerNode = outerNeighbor
-                tempPath.append(currentOuterNode)
-
-                while True:
-                    #check if next node is deadend or crossroad
-                    currentEdgeKey = str((lastNode,currentInnerNode))
-                    totalweight += self.fullPathGraph[lastNode][currentInnerNode]["weight"]
-                    pathwidth = self.fullPathGraph[lastNode][currentInnerNode]["pathwidth"]
-                    maxpath = max(maxpath, pathwidth)
-                    minpath = min(minpath, pathwidth)
-                   
-
-                    if currentInnerNode in stoppers:
-                        #found a crossroad or deadend
-                        tempPath.append(currentInnerNode)
-                        #tempPath = self.filterZigZag(tempPath, pos) 
-                        tempPath = {i:(node,pos[node]) for i, node in enumerate(tempPath)}
-                        tempPath = self.filterZigZag(tempPath, self.boundarySpacing * 5) 
-                        #Prevent going back and forth between direct connected crossroads 
-                        if lastNode != currentOuterNode:
-                            visited.add(lastNode)
-                        nodes_to_visit.append(currentInnerNode)
-
-                        pathtype = "oneway"
-                        if minpath > self.minTwoWayPathWidth: pathtype = "twoway"
-
-                        if "isMachineConnection" in self.fullPathGraph.nodes[currentOuterNode] or "isMachineConnection" in self.fullPathGraph.nodes[currentInnerNode]:
-                            machineConnection = True
-                        else:
-                            machineConnection = False
-
-                        self.reducedPathGraph.add_node(currentOuterNode, pos=pos[currentOuterNode])
-                        self.reducedPathGraph.add_node(currentInnerNode, pos=pos[currentInnerNode])
-                        self.reducedPathGraph.add_edge(currentOuterNode, 
-                            currentInnerNode, 
-                            weight=totalweight,
-                            pathwidth=minpath, 
-                            max_pathwidth=maxpath, 
-                            nodelist=tempPath,
-                            pathtype=pathtype,
-                            isMachineConnection=machineConnection
-                        )
-
-                        tempPath = [] 
-                        break 
-                    else:
-                        #going along path
-                        tempPath.append(currentInnerNode)
-
-                    for innerNeighbor in self.fullPathGraph.neighbors(currentInnerNode):
-                        #Identifying next node (there will at most be two edges connected to every node)
-                        if (innerNeighbor == lastNode):
-                            #this is last node
-                            continue
-                        else:
-                            #found the next one
-                            lastNode = currentInnerNode
-                            currentInnerNode = innerNeighbor
-                            break
+                machineConnection = False
+
+            self.reducedPathGraph.add_node(currentOuterNode, pos=pos[currentOuterNode])
+            self.reducedPathGraph.add_node(currentInnerNode, pos=pos[currentInnerNode])
+            self.reducedPathGraph.add_edge(currentOuterNode, 
+                currentInnerNode, 
+                weight=totalweight,
+                pathwidth=minpath, 
+                max_pathwidth=maxpath, 
+                nodelist=tempPath,
+                pathtype=pathtype,
+                isMachineConnection=machineConnection
+            )
 
         #Calculate support information
-        nx.set_node_attributes(self.fullPathGraph, self.calculateNodeAngles())
+        self.angleNodes, self.nodeAngles = self.calculateNodeAngles()
+        #Drawing reads the angles from the nodes, the KPIs use the arrays directly
+        for name, values in self.nodeAngles.items():
+            nx.set_node_attributes(self.fullPathGraph, dict(zip(self.angleNodes, values.tolist())), name)
         #Currently not necessary since rdp takes care of this
         #nx.set_node_attributes(self.fullPathGraph, self.findSupportNodes(cutoff=self.simplificationAngle))
         #self.support = list(nx.get_node_attributes(self.fullPathGraph, "isSupport").keys())
 
-        if self.TIMING: 
-            self.timelog("Network Path Generation")
-            print(f"Algorithm Total: {self.nextTime - self.totalTime}")
+        self.profiler.lap("routing/Network Path Generation")
         
         
 
@@ -448,39 +385,81 @@ class FactoryPath():
 
 
 # Support Functions    --------------------------------------------------------------------------------------------------------------------------------------------------
+    def wallContext(self, wall_dict, scale=1):
+        """Returns the geometry derived from the walls, which does not change while machines are moved.
+        The result is cached until other walls or a different boundary spacing are used.
+
+        Returns:
+            tuple: list of wall polygons, union of walls, ring around the convex hull of the walls and points along the wall boundary
+            None if the walls do not form a polygon (e.g. no walls at all)
+        """
+        #Walls are identified by their key and pose, not by id, so copies of the factory hit the cache and new walls never match old ids
+        key = (tuple((name, wall.gid, wall.origin, wall.rotation, wall.bounds) for name, wall in wall_dict.items()), self.boundarySpacing * scale)
+        if self._wallContextKey == key:
+            return self._wallContext
+
+        walllist = [x.poly for x in wall_dict.values()]
+        union = unary_union(walllist)
+        if union.geom_type == "MultiPolygon":
+            walls = MultiPolygon(union)
+        elif union.geom_type == "Polygon":
+            walls = MultiPolygon([union])
+        else:
+            return None
+
+        outerRing = walls.convex_hull.buffer(100)- walls.convex_hull
+        distances = np.arange(0,  walls.boundary.length, self.boundarySpacing * scale)
+        wallPoints = [walls.boundary.interpolate(distance) for distance in distances]
+
+        self._wallContextKey = key
+        self._wallContext = (walllist, walls, outerRing, wallPoints)
+        return self._wallContext
+
     def calculateNodeAngles(self):
-        node_data ={}
+        """Angles at the inner nodes of all reduced edges, calculated at once on the stacked coordinates of all node lists.
+        A node that is part of several edges gets the values of the last one.
+
+        Returns:
+            tuple: list of nodes and dict with the arrays edge_angle, arcstart, arcend, gamma1 and gamma2 in the same order
+        """
         pos=nx.get_node_attributes(self.fullPathGraph, 'pos')
 
+        nodes = []
+        coords = []
         for u,v,data in self.reducedPathGraph.edges(data=True):
+            if len(data['nodelist']) > 2:
+                nodes.extend(str(node) for node in data['nodelist'][1:-1])
+                points = np.array([pos[node] for node in data['nodelist']], dtype=np.float64)
+                #previous, current and next point of every inner node
+                coords.append(np.stack([points[:-2], points[1:-1], points[2:]], axis=1))
 
-            for index, node in enumerate(data['nodelist'][1:-1]):
-                node = str(node)
-                neighbors = [data['nodelist'][index], data['nodelist'][index+2]]
-                
-                vector_1 = np.array(pos[neighbors[0]]) -np.array(pos[node])
-                vector_2 = np.array(pos[neighbors[1]]) - np.array(pos[node])
-
-                unit_vector_1 = vector_1 / np.linalg.norm(vector_1)
-                unit_vector_2 = vector_2 / np.linalg.norm(vector_2)
+        if not coords:
+            return [], {name: np.empty(0) for name in ("edge_angle", "arcstart", "arcend", "gamma1", "gamma2")}
 
-                dot_product = np.dot(unit_vector_1, unit_vector_2)
-                angle = np.rad2deg(np.arccos(np.clip(dot_product, -1.0, 1.0)))
+        coords = np.concatenate(coords)
+        #Keep the last occurrence of every node in the order of the first one
+        lastIndex = {node: i for i, node in enumerate(nodes)}
+        coords = coords[np.fromiter(lastIndex.values(), dtype=np.intp, count=len(lastIndex))]
 
-                theta1 = np.arctan2(vector_1[1],vector_1[0])
-                theta2 = np.arctan2(vector_2[1],vector_2[0])
-                
-                vector_1 = np.array(pos[node]) - np.array(pos[neighbors[0]])
-                gamma1 = np.arctan2(vector_1[1],vector_1[0])
-                gamma2 = np.arctan2(vector_2[1],vector_2[0])
+        vector_1 = coords[:, 0] - coords[:, 1]
+        vector_2 = coords[:, 2] - coords[:, 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            unit_vector_1 = vector_1 / np.linalg.norm(vector_1, axis=1)[:, None]
+            unit_vector_2 = vector_2 / np.linalg.norm(vector_2, axis=1)[:, None]
+        dot_product = np.einsum("ij,ij->i", unit_vector_1, unit_vector_2)
+        angle = np.rad2deg(np.arccos(np.clip(dot_product, -1.0, 1.0)))
 
-                if gamma1 > gamma2:
-                    theta1, theta2 = theta2, theta1
+        theta1 = np.arctan2(vector_1[:, 1], vector_1[:, 0])
+        theta2 = np.arctan2(vector_2[:, 1], vector_2[:, 0])
+        #Direction of the incoming and outgoing segment
+        gamma1 = np.arctan2(-vector_1[:, 1], -vector_1[:, 0])
+        gamma2 = theta2
 
-                node_data[node] = {"edge_angle" : angle, "arcstart" : theta1, "arcend" : theta2, "gamma1" : gamma1, "gamma2" : gamma2}
+        swap = gamma1 > gamma2
+        arcstart = np.where(swap, theta2, theta1)
+        arcend = np.where(swap, theta1, theta2)
 
-
-        return node_data
+        return list(lastIndex), {"edge_angle" : angle, "arcstart" : arcstart, "arcend" : arcend, "gamma1" : gamma1, "gamma2" : gamma2}
 
 
     def findSupportNodes(self, cutoff=45):
@@ -531,112 +510,163 @@ class FactoryPath():
         return node_data
 
 
-    def pruneAlongPath(self, F, starts=[], ends=[], min_length=1):
-        shortDeadEnds =[]
+    def contractChains(self, F, stoppers, start):
+        """Contracts the chains of nodes between stoppers into single edges, searching depth first from start.
+        Works on integer adjacency lists built once from F, so every chain is walked without graph lookups.
 
-        for seed in starts:
+        Args:
+            F (nx.Graph): graph with weight and pathwidth on every edge
+            stoppers (set): nodes where chains end, at least all nodes with a degree other than 2
+            start: node to start from, only its connected component is contracted
 
-            total_length = 0
-            currentNode = seed
-            nextNode = None
-            lastNode = None
-            tempDeadEnds = []
+        Returns:
+            list: first node, last node, nodelist, summed weight, min and max pathwidth of every chain in the order they are found
+        """
+        nodes = list(F.nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+        adjacency = [[index[neighbor] for neighbor in F.adj[node]] for node in nodes]
+        weights = [[data["weight"] for data in F.adj[node].values()] for node in nodes]
+        pathwidths = [[data["pathwidth"] for data in F.adj[node].values()] for node in nodes]
+        isStopper = [node in stoppers for node in nodes]
+
+        chains = []
+        visited = [False] * len(nodes)
+        nodes_to_visit = [index[start]]
+
+        while nodes_to_visit:
+            outer = nodes_to_visit.pop()
+            if visited[outer]:
+                continue
+            visited[outer] = True
+
+            for k, first in enumerate(adjacency[outer]):
+                if visited[first]: continue
+
+                path = [outer]
+                chainWeights = [weights[outer][k]]
+                chainWidths = [pathwidths[outer][k]]
+                last, current = outer, first
+                while not isStopper[current]:
+                    path.append(current)
+                    #Inner nodes have two neighbors, continue with the one we did not come from
+                    j = 0 if adjacency[current][0] != last else 1
+                    chainWeights.append(weights[current][j])
+                    chainWidths.append(pathwidths[current][j])
+                    last, current = current, adjacency[current][j]
+                path.append(current)
+
+                #Prevent going back and forth between direct connected crossroads 
+                if last != outer:
+                    visited[last] = True
+                nodes_to_visit.append(current)
+
+                chains.append((nodes[outer], nodes[current], [nodes[i] for i in path], sum(chainWeights), min(chainWidths), max(chainWidths)))
+
+        return chains
+
+    def pruneAlongPath(self, F, starts=[], keep=(), min_length=1):
+        """Removes dead ends not longer than min_length from F until none is left.
+        All endpoints are followed to the next crossroad in one round and the short branches are removed together.
+        Crossroads left with a single edge are the endpoints of the next round, so the graph is never scanned again.
+        Unlike the former two fixed passes, a short chain ending at a node in keep is not removed. Before, a chain
+        from an endpoint to a machine connection without a crossroad in between was pruned together with the machine node.
+
+        Args:
+            F (nx.Graph): graph with a weight on every edge, changed in place
+            starts (list, optional): endpoints to start from. Defaults to [].
+            keep (set, optional): nodes that are never removed, a branch leading to one of them is kept. Defaults to ().
+            min_length (int, optional): branches up to this length are removed. Defaults to 1.
+
+        Returns:
+            list: removed nodes
+        """
+        shortDeadEnds = []
 
-            #check if there is something to do
-            if len(F.edges())<=1:
-                return []
+        #check if there is something to do
+        if F.number_of_edges() <= 1:
+            return shortDeadEnds
 
-            #Follow path from endnode to next crossroads, track length of path
-            while True:
+        adjacency = F.adj
+        while starts:
+            removed = {}
+            crossroads = {}
 
-                nextNode = None
-                for neighbor in F.neighbors(currentNode):
-                    #Identifying next node (there will at most be two edges connected to every node)
-                    if (neighbor == lastNode):
-                        #this is last node
-                        continue
-                    else:
-                        #found the next one
-                        nextNode = neighbor
-                        break
-                # keep track of route length
-                if nextNode:
-                    total_length += F.edges[currentNode, nextNode]["weight"]
-                #Stop if route is longer than min_length
-                if total_length > min_length:
-                    break
-
-                if nextNode in ends or nextNode is None:
-                    tempDeadEnds.append(currentNode)
-                    shortDeadEnds.extend(tempDeadEnds)
-                    break 
-                else:
+            for seed in starts:
+                if seed in removed or seed in keep or len(adjacency[seed]) != 1:
+                    continue
+
+                total_length = 0
+                currentNode = seed
+                lastNode = None
+                tempDeadEnds = []
+
+                #Follow path from endnode to next crossroads, track length of path
+                while True:
                     tempDeadEnds.append(currentNode)
+                    nextNode = next((neighbor for neighbor in adjacency[currentNode] if neighbor != lastNode), None)
+                    if nextNode is None:
+                        #Reached the other end of a path without crossroads
+                        break
+                    # keep track of route length
+                    total_length += adjacency[currentNode][nextNode]["weight"]
+                    #Stop if route is longer than min_length or leads to a node to keep
+                    if total_length > min_length or nextNode in keep:
+                        tempDeadEnds = []
+                        break
+                    if len(adjacency[nextNode]) >= 3:
+                        crossroads[nextNode] = None
+                        break
                     lastNode = currentNode
                     currentNode = nextNode
-        
-        return shortDeadEnds
 
+                removed.update(dict.fromkeys(tempDeadEnds))
 
-    def filterZigZag(self, d, epsilon):
-        """
-        Simplify a curve represented by a dict of node IDs and (x, y) coordinates using
-        the Ramer-Douglas-Peucker algorithm.
+            if not removed:
+                break
+            F.remove_nodes_from(removed)
+            shortDeadEnds.extend(removed)
+            starts = [node for node in crossroads if node in adjacency and len(adjacency[node]) == 1]
 
-        :param d: a dictionary with node IDs as keys and (x, y) coordinates as values
-        :param epsilon: the maximum distance between a curve point and its approximation
-        :return: a new dictionary with a subset of the input nodes that approximate the curve
-        """
-        # Create a new dictionary with integer keys and the same values as the original dictionary
+        return shortDeadEnds
 
-        
-        def rdp_recursive(start, end):
-            """
-            Simplify a curve segment represented by two indices using the Ramer-Douglas-Peucker algorithm.
-
-            :param start: the index of the start node of the segment
-            :param end: the index of the end node of the segment
-            :return: a list of indices that approximate the segment
-            """
-            if end - start == 1:
-                # Base case: only two nodes, return both
-                return [start, end]
-            elif end <= start:
-                # Degenerate case: no nodes
-                return []
-            elif start == end:
-                return [start]
-            else:
-                # Compute the perpendicular distance of all nodes to the line segment
-                dmax = -1
-                idx_max = -1
-                # dict is {0: (node_id, (x,y)), 1: (node_id, (x,y)), ...}
-                p0 = np.array(d[start][1])
-                p1 = np.array(d[end][1])
-                for i in range(start + 1, end):
-
-                    p = np.array(d[i][1])
-                    d1 = np.linalg.norm(p-p0)
-                    d2 = np.linalg.norm(p-p1)
-
-                    d0 = np.abs(d1 * (p1[1] - p0[1]) - (p1[0] - p0[0]) * d2) / (dist(p1, p0)+0.00000001)
-                    if d0 > dmax:
-                        dmax = d0
-                        idx_max = i
-                if dmax <= epsilon:
-                    # All nodes are close enough to the line segment, return only the start and end nodes
-                    return [start, end]
-                else:
-                    # Recursively simplify the left and right segments
-                    left = rdp_recursive(start, idx_max)
-                    right = rdp_recursive(idx_max, end)
-                    # Combine the left and right segments
-                    return left + right[1:]
 
-        # Call the recursive function with the indices of the first and last nodes
-        indices = rdp_recursive(0, len(d) - 1)
-        # Map the integer indices back to their corresponding dictionary keys
-        return [list(d.values())[i][0] for i in indices]
+    def filterZigZag(self, nodes, coords, epsilon):
+        """Simplify a path with the Ramer-Douglas-Peucker algorithm.
+        Segments are split iteratively, the distances of all nodes of a segment are calculated at once.
+
+        Args:
+            nodes (list): node ids along the path
+            coords (np.ndarray): (k, 2) coordinates of the nodes
+            epsilon (float): the maximum distance between a path node and its approximation
+
+        Returns:
+            list: subset of nodes approximating the path, always including the first and last node
+        """
+        count = len(nodes)
+        if count < 2:
+            return []
+        coords = np.asarray(coords, dtype=np.float64)
+        keep = np.zeros(count, dtype=bool)
+        keep[0] = keep[-1] = True
+        segments = [(0, count - 1)]
+        while segments:
+            start, end = segments.pop()
+            if end - start < 2:
+                continue
+            p0 = coords[start]
+            p1 = coords[end]
+            inner = coords[start + 1:end]
+            d1 = np.sqrt(((inner - p0) ** 2).sum(axis=1))
+            d2 = np.sqrt(((inner - p1) ** 2).sum(axis=1))
+            #Distance measure of the former recursive implementation, kept so the simplified paths do not change
+            d0 = np.abs(d1 * (p1[1] - p0[1]) - (p1[0] - p0[0]) * d2) / (dist(p1, p0)+0.00000001)
+            index = int(np.argmax(d0))
+            if d0[index] > epsilon:
+                split = start + 1 + index
+                keep[split] = True
+                segments.append((start, split))
+                segments.append((split, end))
+        return [node for node, kept in zip(nodes, keep) if kept]
 
 
 
@@ -712,7 +742,7 @@ if __name__ == "__main__":
 
 
         factoryPath = FactoryPath(boundarySpacing=500, minDeadEndLength=2000, minPathWidth=1000, maxPathWidth=2500, minTwoWayPathWidth=2000, simplificationAngle=35)
-        factoryPath.TIMING = True
+        factoryPath.profiler = Profiler(enabled=True, echo=True)
         factoryPath.PLOTTING = True
         factoryPath.calculateAll(machine_dict, wall_dict, bb)
         pos=nx.get_node_attributes(factoryPath.fullPathGraph,'pos')
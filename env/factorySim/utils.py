@@ -1,9 +1,12 @@
+import os
+import socket
+import threading
 from shapely.affinity import  scale, rotate, translate
-from ifcopenshell.api import run
 import numpy as np
-import ifcopenshell
-import copy
-import requests
+from collections import namedtuple
+
+#Placement of a factory object together with its geometry prepared for IFC export
+ExportElement = namedtuple("ExportElement", ["name", "origin", "rotation", "width", "height", "poly"])
 
 def prepare_for_export(element_dict, bb):
     """This function moves the geometry to the center of the bounding box and flips the y-axis to match the IFC coordinate system
@@ -13,23 +16,28 @@ def prepare_for_export(element_dict, bb):
         bb (_type_): bounding box of the factory
 
     Returns:
-        _type_: dict of transformed factory objects
+        _type_: dict of ExportElements holding the transformed geometry and the placement of the original factory objects
     """
-    new_dict = copy.deepcopy(element_dict)
-    for element in new_dict.values():
-        element.poly = rotate(element.poly, element.rotation, origin="center", use_radians=True)
+    new_dict = {}
+    for key, element in element_dict.items():
+        poly = rotate(element.poly, element.rotation, origin="center", use_radians=True)
         #Fix mirroring 
-        element.poly = scale(element.poly, yfact=-1, origin=bb.centroid)
+        poly = scale(poly, yfact=-1, origin=bb.centroid)
         #Set origin to the center of the bounding box
-        bounds = element.poly.bounds
-        element.poly = translate(element.poly, 
-                                 xoff=-(bounds[0] + (bounds[2] - bounds[0])/2), 
-                                 yoff=-(bounds[1] + (bounds[3] - bounds[1])/2)
+        bounds = poly.bounds
+        poly = translate(poly, 
+                         xoff=-(bounds[0] + (bounds[2] - bounds[0])/2), 
+                         yoff=-(bounds[1] + (bounds[3] - bounds[1])/2)
         )
+        new_dict[key] = ExportElement(element.name, element.origin, element.rotation, element.width, element.height, poly)
       
     return new_dict
 
 def write_ifc_class(model, ifc_context, ifc_class, element_dict, factoryheight):
+    import ifcopenshell
+    import ifcopenshell.api.geometry
+    import ifcopenshell.util.placement
+    from ifcopenshell.api import run
     elements = []
 
     for element in element_dict.values():
@@ -90,17 +98,43 @@ def write_ifc_class(model, ifc_context, ifc_class, element_dict, factoryheight):
         elements.append(ifc_element)
     return elements
 
-def check_internet_conn():
-# initializing URL
-    url = "https://www.google.de"
-    timeout = 3
-    try:
-        # requesting URL
-        request = requests.get(url,
-                            timeout=timeout)
-        return True
-    
-    # catching exception
-    except (requests.ConnectionError,
-            requests.Timeout) as exception:
+def check_internet_conn(host="www.google.de", port=443, timeout=0.5):
+    """Checks if a TCP connection to host can be opened, without sending a request
+
+    The environment variable FACTORYSIM_ONLINE set to 1 or 0 skips the check, e.g. on offline cluster nodes.
+    Name resolution runs on a daemon thread that is only waited for timeout seconds, so a resolver without network
+    does not stall the caller. The thread itself is not interrupted and ends when the resolver gives up.
+
+    Args:
+        host (str, optional): host that has to be reachable, e.g. the MQTT broker. Defaults to "www.google.de".
+        port (int, optional): port on host. Defaults to 443.
+        timeout (float, optional): seconds to wait for name resolution and for every connection attempt. Defaults to 0.5.
+
+    Returns:
+        bool: True if the connection could be opened
+    """
+    override = os.environ.get("FACTORYSIM_ONLINE")
+    if override is not None:
+        return override.strip().lower() in ("1", "true", "yes", "on")
+    if not host:
         return False
+
+    addresses = []
+    def resolve():
+        try:
+            addresses.extend(socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        except OSError:
+            pass
+    resolver = threading.Thread(target=resolve, name="resolve", daemon=True)
+    resolver.start()
+    resolver.join(timeout)
+    if resolver.is_alive():
+        return False
+
+    for *_, sockaddr in addresses:
+        try:
+            with socket.create_connection(sockaddr[:2], timeout=timeout):
+                return True
+        except OSError:
+            continue
+    return False
@@ -1,7 +1,6 @@
 from array import array
-from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 from enum import Enum
-import queue
 import json
 import os
 import yaml
@@ -20,6 +19,10 @@ from factorySim.creation import FactoryCreator
 import factorySim.baseConfigs as baseConfigs
 from factorySim.factoryObject import FactoryObject
 from factorySim.factorySimEnv import FactorySimEnv
+from factorySim.evaluation import EvaluationService
+from factorySim.mqttInbox import MQTTInbox
+from factorySim.mqttReplay import LocalClient, LOCAL_BROKER, Replayer, loadRecording, report
+from factorySim.profiling import Profiler
 from factorySim.utils import check_internet_conn
 
 from ray.rllib.policy.policy import Policy
@@ -77,6 +80,8 @@ class factorySimLive(mglw.WindowConfig):
     window_size = (1280, 720)
     #window_size = (1920*6, 1080)
     mqtt_broker = "broker.emqx.io"
+    mqtt_transport = "paho" # "local" uses the in-process stand-in broker, for replays without network
+    mqtt_replay = None # Recording of mqttReplay.Recorder that is replayed into the local broker
     #mqtt_broker = "10.54.129.47"
     aspect_ratio = None
     fullscreen = False
@@ -85,28 +90,31 @@ class factorySimLive(mglw.WindowConfig):
     currentScale = 1.0
     is_darkmode = True
     is_EDF = False
-    is_dirty = False
-    is_calculating = False
     is_shrunk = False
-    update_during_calculation = False
     clickedPoints = []
     #
     factoryConfig = baseConfigs.SMALLSQUARE
     #factoryConfig = baseConfigs.EDF_EMPTY
     #factoryConfig = baseConfigs.EDF
-    mqtt_Q = None # Holds mqtt messages till they are processed
+    mqttInbox = None # Holds mqtt messages till they are processed
     cursorPosition = None
     currenDebugMode = 0
     dpiScaler = 2 if sys.platform == "darwin" else 1
-    is_online = check_internet_conn()
+    is_online = None # None checks if mqtt_broker is reachable when the window opens, True or False skips the check
     EVALUATION = False
+    texture = None
+    evaluationCount = 0 # Increased with every new fast or full result, overlays are redrawn when it changes
+    layoutChanged = False # Set by update_needed, the layout is evaluated once per frame
+    staticKey = None # State the cached layers and the texture were drawn with
+    overlayKey = None
+    frameKey = None
 
       
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.rng = np.random.default_rng()
         self.cmap = self.rng.random(size=(200, 3))
-        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.evaluationService = EvaluationService(rewardMode=1)
 
 
         
@@ -155,14 +163,26 @@ class factorySimLive(mglw.WindowConfig):
 
 
         #MQTT Connection
-        self.mqtt_Q = queue.Queue(maxsize=100)
-        if self.is_online:
-            self.mqtt_client = mqtt.Client(client_id="factorySimLive")
+        self.mqttInbox = MQTTInbox()
+        self.mqttProfiler = Profiler(enabled=True) # Time from arrival to application of messages
+        self.mqtt_client = None
+        if self.mqtt_transport == "local":
+            self.mqtt_client = LocalClient(LOCAL_BROKER, client_id="factorySimLive")
+        else:
+            if self.is_online is None:
+                self.is_online = check_internet_conn(self.mqtt_broker, 1883)
+            if self.is_online:
+                self.mqtt_client = mqtt.Client(client_id="factorySimLive")
+        if self.mqtt_client:
             self.mqtt_client.on_connect = self.on_connect
             self.mqtt_client.on_disconnect = self.on_disconnect
             self.mqtt_client.on_message = self.on_message
             self.mqtt_client.connect(self.mqtt_broker, 1883)
             self.mqtt_client.loop_start()
+        self.replayer = None
+        if self.mqtt_transport == "local" and self.mqtt_replay:
+            self.replayer = Replayer(loadRecording(self.mqtt_replay), LOCAL_BROKER.publish)
+            self.replayer.start()
         
         #Agent 
         if False:
@@ -219,9 +239,12 @@ class factorySimLive(mglw.WindowConfig):
 
     def close(self):
         print("closing")
-        self.executor.shutdown()
-        if self.is_online:
+        self.evaluationService.close()
+        if self.replayer:
+            self.replayer.stop()
+        if self.mqtt_client:
             self.mqtt_client.loop_stop()
+            print(report(self.mqttInbox, self.mqttProfiler, self.replayer.sent if self.replayer else 0))
         
 
     def key_event(self, key, action, modifiers):
@@ -286,7 +309,7 @@ class factorySimLive(mglw.WindowConfig):
                 self.set_factoryScale()
                 self.nextGID = len(self.env.factory.machine_dict)
                 self.selected = None
-                self.is_dirty = True
+                self.update_needed()
             # Darkmode
             if key == keys.B:
                 self.is_darkmode = not self.is_darkmode
@@ -302,7 +325,7 @@ class factorySimLive(mglw.WindowConfig):
                 self.activeModes[Modes.DRAWING] = DrawingModes.NONE
                 self.wnd.exit_key = keys.ESCAPE
             # Del to delete
-            if key == keys.BACKSPACE and self.selected is not None and not self.is_calculating:
+            if key == keys.BACKSPACE and self.selected is not None:
                 self.F_delete_item(self.selected)
                 self.selected = None
 
@@ -399,32 +422,32 @@ class factorySimLive(mglw.WindowConfig):
         texture = self.render_cairo_to_texture()
         texture.use(location=0)
         self.screen_rectangle.render(mode=moderngl.TRIANGLE_STRIP)
-        texture.release()
         self.process_mqtt()
 
 
     def render_cairo_to_texture(self):
-        # Draw with cairo to surface
-        draw_BG(self.cctx, self.env.factory.DRAWINGORIGIN,*self.env.factory.FACTORYDIMENSIONS, self.is_darkmode)
-        
-        if self.is_dirty:
-            if self.is_calculating:
-                if self.future.done():
-                    _, _ , self.rating, _ = self.future.result()
-                    self.is_dirty = False
-                    self.is_calculating = False
-                    #if we had changes during last calulation, recalulate
-                    if self.update_during_calculation:
-                        self.update_during_calculation = False
-                        self.is_dirty = True
-                        self.is_calculating = True
-                        self.future = self.executor.submit(self.env.factory.evaluate)
-            else:
-                self.future = self.executor.submit(self.env.factory.evaluate)
-                self.is_calculating = True
-        color = (0.0, 0.0, 0.0) if self.is_darkmode else (1.0, 1.0, 1.0)
-        
+        #Results of the background evaluation are swapped in between two frames
+        result = self.evaluationService.takeResult()
+        #Snapshots of a replaced factory are ignored
+        if result is not None and result[0] >= self.firstSnapshot:
+            number, snapshot, (_, _, self.rating, _) = result
+            #The materialflow of an outdated snapshot may refer to machines that were deleted since, only its routes are taken together with the graphs
+            isCurrent = self.evaluationService.isCurrent(number)
+            self.env.factory.adoptEvaluation(snapshot, materialflow=isCurrent)
+            #The layout changed since the snapshot, fast results of the current layout stay on top of the full ones
+            if not isCurrent and not self.layoutChanged:
+                self.env.factory.evaluateFast()
+            self.evaluationCount += 1
+        self.evaluateChanges()
+
+        #Nothing that is drawn changed, the texture still shows the last frame
+        frameKey = self.currentFrameKey()
+        if frameKey == self.frameKey:
+            return self.texture
+        self.frameKey = frameKey
+
         if self.activeModes[Modes.AGENTDEBUG]:
+            draw_BG(self.cctx, self.env.factory.DRAWINGORIGIN,*self.env.factory.FACTORYDIMENSIONS, self.is_darkmode)
             match self.currenDebugMode:
                 case 0:
                     draw_obs_layer_A(self.cctx, self.env.factory, highlight=self.selected)
@@ -433,31 +456,26 @@ class factorySimLive(mglw.WindowConfig):
                 case 2:
                     draw_text(self.cctx,(f"Easteregg"), (0.7, 0.0, 0.0, 1.0), (self.window_size[0]/2,self.window_size[1]/2), factoryCoordinates=False)
         else:
-            drawFactory(self.cctx, self.env.factory, drawColors=True, highlight=self.selected, drawNames=True, darkmode=self.is_darkmode, drawWalls=True, drawOrigin=True)
-            if self.activeModes[Modes.MODE9]: 
-                draw_poly(self.cctx, self.env.factory.walkableArea, (0.9, 0.0, 0.0, 0.5), drawHoles=True)
-            if self.activeModes[Modes.MODE7]: 
-                draw_poly(self.cctx, self.env.factory.freeSpacePolygon, (0.0, 0.0, 1.0, 0.5), drawHoles=True)
-                draw_poly(self.cctx, self.env.factory.growingSpacePolygon, (1.0, 1.0, 0.0, 0.5), drawHoles=True)
-            if self.activeModes[Modes.MODE_N0]: draw_poly(self.cctx,  self.env.factory.freespaceAlongRoutesPolygon, (0.0, 0.6, 0.0, 0.5))
-            if self.activeModes[Modes.MODE_N9]: draw_poly(self.cctx, self.env.factory.extendedPathPolygon, (0.0, 0.3, 0.0, 1.0))
-            if self.activeModes[Modes.MODE3]: draw_poly(self.cctx, self.env.factory.pathPolygon, (0.0, 0.3, 0.0, 1.0))
-            if self.activeModes[Modes.MODE1]: draw_detail_paths(self.cctx, self.env.factory.fullPathGraph, self.env.factory.reducedPathGraph, asStreets=True)
-            if self.activeModes[Modes.MODE2]: draw_simple_paths(self.cctx, self.env.factory.fullPathGraph, self.env.factory.reducedPathGraph)
-            if self.activeModes[Modes.MODE_N8]: draw_route_lines(self.cctx, self.env.factory.factoryPath.route_lines)
-            drawFactory(self.cctx, self.env.factory, drawColors=True, highlight=self.selected, drawNames=True, drawWalls=False)
-            if self.activeModes[Modes.MODE8]:   
-                for key, poly in self.env.factory.usedSpacePolygonDict.items():
-                    draw_poly(self.cctx, poly, (*self.cmap[key], 0.3))
-            if self.activeModes[Modes.MODE_N7]: draw_pathwidth_circles(self.cctx, self.env.factory.fullPathGraph)
-            if self.activeModes[Modes.MODE0]:draw_node_angles(self.cctx, self.env.factory.fullPathGraph, self.env.factory.reducedPathGraph)
-            if self.activeModes[Modes.MODE5]: 
-                drawMaterialFlow(self.cctx, self.env.factory.machine_dict, self.env.factory.dfMF, drawColors=True)
-                draw_points(self.cctx, self.env.factory.MFIntersectionPoints, (1.0, 1.0, 0.0, 1.0))
-            if self.activeModes[Modes.MODE4]: 
-                drawCollisions(self.cctx, self.env.factory.machineCollisionList, wallCollisionList=self.env.factory.wallCollisionList, outsiderList=self.env.factory.outsiderList)
-            if self.activeModes[Modes.MODE6]: 
-                drawRoutedMaterialFlow(self.cctx, self.env.factory.machine_dict, self.env.factory.fullPathGraph, self.env.factory.reducedPathGraph, materialflow_file=self.env.factory.dfMF, selected=None)
+            self.updateLayerCache()
+            #Cached layers are copied without the factory transformation
+            self.cctx.save()
+            self.cctx.identity_matrix()
+            self.cctx.set_operator(cairo.OPERATOR_SOURCE)
+            self.cctx.set_source_surface(self.staticSurface, 0, 0)
+            self.cctx.paint()
+            self.cctx.set_operator(cairo.OPERATOR_OVER)
+            self.cctx.set_source_surface(self.underSurface, 0, 0)
+            self.cctx.paint()
+            self.cctx.restore()
+
+            #Machines move between evaluations, they are drawn every frame
+            drawFactory(self.cctx, self.env.factory, drawColors=True, highlight=self.selected, drawNames=True, drawWalls=False, drawOrigin=True)
+
+            self.cctx.save()
+            self.cctx.identity_matrix()
+            self.cctx.set_source_surface(self.overSurface, 0, 0)
+            self.cctx.paint()
+            self.cctx.restore()
 
             if self.is_EDF:
                 for key, mobile in self.mobile_dict.items():
@@ -490,21 +508,105 @@ class factorySimLive(mglw.WindowConfig):
 
         
         # Copy surface to texture
-        texture = self.ctx.texture((self.window_size[0], self.window_size[1]), 4, data=self.surface.get_data())
-        texture.swizzle = 'BGRA' # use Cairo channel order (alternatively, the shader could do the swizzle)
-
-        return texture
+        self.surface.flush()
+        self.texture.write(self.surface.get_data())
+
+        return self.texture
+
+    def currentFrameKey(self):
+        #Everything a frame depends on besides the cached layers, compared instead of redrawing unchanged frames
+        factory = self.env.factory
+        poses = tuple((machine.origin, machine.rotation) for machine in factory.machine_dict.values())
+        mobiles = tuple((mobile.origin, mobile.rotation) for mobile in self.mobile_dict.values()) if self.is_EDF else None
+        return (self.staticKey, self.evaluationCount, tuple(self.activeModes.items()), self.currenDebugMode, self.is_darkmode, self.is_EDF,
+                round(self.fps_counter), self.selected, tuple(map(tuple, self.clickedPoints)), self.cursorPosition, id(factory), poses, mobiles)
+
+    def updateLayerCache(self):
+        #Background and walls only change with the view, darkmode or a new factory
+        staticKey = (self.window_size, self.currentScale, self.is_darkmode, id(self.env.factory))
+        if staticKey != self.staticKey:
+            self.staticKey = staticKey
+            self.overlayKey = None
+            self.clearLayer(self.staticCtx)
+            draw_BG(self.staticCtx, self.env.factory.DRAWINGORIGIN,*self.env.factory.FACTORYDIMENSIONS, self.is_darkmode)
+            if self.env.factory.wall_dict:
+                draw_walls(self.staticCtx, self.env.factory.wall_dict, self.is_darkmode)
+
+        #Overlays show results of the evaluation and are only redrawn when a new one finished or the modes changed
+        overlayKey = (self.evaluationCount, tuple(self.activeModes.items()))
+        if overlayKey == self.overlayKey:
+            return
+        self.overlayKey = overlayKey
+        factory = self.env.factory
+
+        ctx = self.clearLayer(self.underCtx)
+        if self.activeModes[Modes.MODE9]: 
+            draw_poly(ctx, factory.walkableArea, (0.9, 0.0, 0.0, 0.5), drawHoles=True)
+        if self.activeModes[Modes.MODE7]: 
+            draw_poly(ctx, factory.freeSpacePolygon, (0.0, 0.0, 1.0, 0.5), drawHoles=True)
+            draw_poly(ctx, factory.growingSpacePolygon, (1.0, 1.0, 0.0, 0.5), drawHoles=True)
+        if self.activeModes[Modes.MODE_N0]: draw_poly(ctx,  factory.freespaceAlongRoutesPolygon, (0.0, 0.6, 0.0, 0.5))
+        if self.activeModes[Modes.MODE_N9]: draw_poly(ctx, factory.extendedPathPolygon, (0.0, 0.3, 0.0, 1.0))
+        if self.activeModes[Modes.MODE3]: draw_poly(ctx, factory.pathPolygon, (0.0, 0.3, 0.0, 1.0))
+        if self.activeModes[Modes.MODE1]: draw_detail_paths(ctx, factory.fullPathGraph, factory.reducedPathGraph, asStreets=True)
+        if self.activeModes[Modes.MODE2]: draw_simple_paths(ctx, factory.fullPathGraph, factory.reducedPathGraph)
+        if self.activeModes[Modes.MODE_N8]: draw_route_lines(ctx, factory.factoryPath.route_lines)
+
+        ctx = self.clearLayer(self.overCtx)
+        if self.activeModes[Modes.MODE8]:   
+            for key, poly in factory.usedSpacePolygonDict.items():
+                draw_poly(ctx, poly, (*self.cmap[key], 0.3))
+        if self.activeModes[Modes.MODE_N7]: draw_pathwidth_circles(ctx, factory.fullPathGraph)
+        if self.activeModes[Modes.MODE0]:draw_node_angles(ctx, factory.fullPathGraph, factory.reducedPathGraph)
+        if self.activeModes[Modes.MODE5]: 
+            drawMaterialFlow(ctx, factory.machine_dict, factory.dfMF, drawColors=True)
+            draw_points(ctx, factory.MFIntersectionPoints, (1.0, 1.0, 0.0, 1.0))
+        if self.activeModes[Modes.MODE4]: 
+            drawCollisions(ctx, factory.machineCollisionList, wallCollisionList=factory.wallCollisionList, outsiderList=factory.outsiderList)
+        if self.activeModes[Modes.MODE6]: 
+            drawRoutedMaterialFlow(ctx, factory.machine_dict, factory.fullPathGraph, factory.reducedPathGraph, materialflow_file=factory.dfMF, selected=None)
+
+    def clearLayer(self, ctx):
+        ctx.save()
+        ctx.set_operator(cairo.OPERATOR_CLEAR)
+        ctx.paint()
+        ctx.restore()
+        return ctx
 
 
 
 #--------------------------------------------------------------------------------------------------------------------------------
     def update_needed(self):
-        self.is_dirty = True
-        if self.is_calculating:
-            self.update_during_calculation = True 
+        #Called for every drag event and mqtt message, the evaluation follows once in the next frame
+        self.layoutChanged = True
+
+    def evaluateChanges(self):
+        if not self.layoutChanged:
+            return
+        self.layoutChanged = False
+        #Collisions and material flow are shown at once, the routing based KPIs follow from the background
+        self.env.factory.evaluateFast()
+        self.evaluationCount += 1
+        self.evaluationService.submit(self.env.factory)
 
     def recreateCairoContext(self):
-        self.surface, self.cctx = self.env.factory.provideCairoDrawingData(self.window_size[0], self.window_size[1], scale=self.currentScale)
+        self.surface, self.cctx = self.env.factory.provideCairoDrawingData(self.window_size[0], self.window_size[1], scale=self.currentScale,
+                                                                           surface=getattr(self, "surface", None), ctx=getattr(self, "cctx", None))
+        #Layers cached between frames, drawn with the same transformation
+        self.staticSurface, self.staticCtx = self.env.factory.provideCairoDrawingData(self.window_size[0], self.window_size[1], scale=self.currentScale,
+                                                                           surface=getattr(self, "staticSurface", None), ctx=getattr(self, "staticCtx", None))
+        self.underSurface, self.underCtx = self.env.factory.provideCairoDrawingData(self.window_size[0], self.window_size[1], scale=self.currentScale,
+                                                                           surface=getattr(self, "underSurface", None), ctx=getattr(self, "underCtx", None))
+        self.overSurface, self.overCtx = self.env.factory.provideCairoDrawingData(self.window_size[0], self.window_size[1], scale=self.currentScale,
+                                                                           surface=getattr(self, "overSurface", None), ctx=getattr(self, "overCtx", None))
+        self.staticKey = None
+        self.frameKey = None
+        #Texture is only allocated again when the window size changed
+        if self.texture is None or self.texture.size != tuple(self.window_size):
+            if self.texture is not None:
+                self.texture.release()
+            self.texture = self.ctx.texture((self.window_size[0], self.window_size[1]), 4)
+            self.texture.swizzle = 'BGRA' # use Cairo channel order (alternatively, the shader could do the swizzle)
 
     def setupKeys(self):
  
@@ -564,7 +666,7 @@ class factorySimLive(mglw.WindowConfig):
         ctx.stroke()
 
 
-    def F_add_rect(self, topleft, bottomright, gid = None, useWindowCoordinates = False):
+    def F_add_rect(self, topleft, bottomright, gid = None, useWindowCoordinates = False, evaluate = True):
         if useWindowCoordinates:
             newRect = box(topleft[0]/self.currentScale, topleft[1]/self.currentScale, bottomright[0]/self.currentScale, bottomright[1]/self.currentScale)
         else:
@@ -581,9 +683,10 @@ class factorySimLive(mglw.WindowConfig):
                                             origin=origin,
                                             poly=MultiPolygon([newRect]))
 
-        self.update_needed()
+        if evaluate:
+            self.update_needed()
 
-    def F_add_poly(self, points, gid = None, useWindowCoordinates = False):
+    def F_add_poly(self, points, gid = None, useWindowCoordinates = False, evaluate = True):
 
         if useWindowCoordinates:
             scaledPoints = np.array(points)/self.currentScale
@@ -603,7 +706,8 @@ class factorySimLive(mglw.WindowConfig):
                                                 name="M_" + str(gid_to_use),
                                                 origin=origin,
                                                 poly=MultiPolygon([newPoly]))
-            self.update_needed()
+            if evaluate:
+                self.update_needed()
 
     def F_delete_item(self, index):
             self.env.factory.machine_dict.pop(index)
@@ -625,8 +729,9 @@ class factorySimLive(mglw.WindowConfig):
         self.env.reset()
 
 
-        self.future = self.executor.submit(self.env.factory.evaluate)
-        _, _ , self.rating, _ = self.future.result()
+        _, _ , self.rating, _ = self.env.factory.evaluate()
+        self.firstSnapshot = self.evaluationService.submitted + 1
+        self.layoutChanged = False
 
     def set_factoryScale(self):
         self.currentScale = self.env.factory.creator.suggest_factory_view_scale(self.window_size[0],self.window_size[1])
@@ -657,19 +762,12 @@ class factorySimLive(mglw.WindowConfig):
         print("Disconnected with result code "+str(rc))
 
     def on_message(self, client, userdata, msg):
-        try:
-            self.mqtt_Q.put_nowait((msg.topic, msg.payload))
-        except queue.Full:
-            print("Dropping message because queue is full.")
-            return
+        self.mqttInbox.put(msg.topic, msg.payload)
 
     def process_mqtt(self):
-        if not self.mqtt_Q.empty():
-            try:
-                topic, payload = self.mqtt_Q.get_nowait()
-            except queue.Empty:
-                print("Tried reading from empty Queue.")
-                return
+        #All waiting messages are applied in one batch, followed by a single evaluation
+        layoutChanged = False
+        for topic, payload, received in self.mqttInbox.drain():
             if topic == "EDF/BP/bg":
                 if payload == b"True":
                     self.is_darkmode = True
@@ -679,9 +777,12 @@ class factorySimLive(mglw.WindowConfig):
                     print("Unknown payload for EDF/BP/bg: " + payload)
             if topic.startswith("EDF/BP/machines/"):
                 if topic.endswith("/pos"):
-                    self.handleMQTT_Position(topic, payload)
+                    layoutChanged |= self.handleMQTT_Position(topic, payload)
                 if topic.endswith("/geom"):
-                    self.handleMQTT_Geometry(topic, payload)
+                    layoutChanged |= self.handleMQTT_Geometry(topic, payload)
+            self.mqttProfiler.record("mqtt/applied", received, perf_counter())
+        if layoutChanged:
+            self.update_needed()
 
 
     def extractID(self, topic):
@@ -696,6 +797,7 @@ class factorySimLive(mglw.WindowConfig):
    
 
     def handleMQTT_Position(self, topic, payload):
+        #Returns True if a machine moved, the caller starts the evaluation
         pp = json.loads(payload)
         index = str(self.extractID(topic))
 
@@ -706,7 +808,7 @@ class factorySimLive(mglw.WindowConfig):
             #if change is larger than 2% of factory size, update
             if maxDelta > max(*self.env.factory.FACTORYDIMENSIONS)*0.02:
                 self.env.factory.machine_dict[index].translate_Item(pp["x"],pp[ "y"])
-                self.update_needed()
+                return True
 
         elif index in self.env.factory.machine_dict and "u" in pp and "v" in pp:
             #input 0-1 -> scale to window coordinates -> scale to current zoom
@@ -721,7 +823,7 @@ class factorySimLive(mglw.WindowConfig):
             #if change is larger than 2% of factory size, update
             if maxDelta > max(*self.env.factory.FACTORYDIMENSIONS)*0.02:
                 self.env.factory.machine_dict[index].translate_Item(scaled_u,scaled_v)
-                self.update_needed()
+                return True
 
         elif index in self.mobile_dict and "x" in pp and "y" in pp:
             self.mobile_dict[index].translate_Item(pp["x"],pp["y"])
@@ -733,19 +835,24 @@ class factorySimLive(mglw.WindowConfig):
             self.mobile_dict[index].translate_Item(scaled_u,scaled_v)
         else:
             print("MQTT message malformed. Needs JSON Payload containing x and y coordinates (u, v coordinates) and valid machine index\n",index)
+        return False
     
     def handleMQTT_Geometry(self, topic, payload):
+        #Returns True if the machines changed, the caller starts the evaluation
         pp = json.loads(payload)
         index = self.extractID(topic)
         if index is not None and "topleft_x5" in pp and "topleft_y" in pp and "bottomright_x" in pp and "bottomright_y" in pp:
-            self.F_add_rect((pp["topleft_x"],pp["topleft_y"]),(pp["bottomright_x"],pp["bottomright_y"]), gid=index)
+            self.F_add_rect((pp["topleft_x"],pp["topleft_y"]),(pp["bottomright_x"],pp["bottomright_y"]), gid=index, evaluate=False)
+            return True
         elif index is not None and "points" in pp:
-            self.F_add_poly(pp["points"], gid=index)
+            self.F_add_poly(pp["points"], gid=index, evaluate=False)
+            return True
         elif index is not None and index in self.env.factory.machine_dict and pp == []:
             self.env.factory.machine_dict.pop(index)
-            self.update_needed()
+            return True
         else:
             print("MQTT message malformed. Needs JSON Payload containing topleft_x, topleft_y, bottomright_x, bottomright_y of rectangle or coordinates of a polygon")
+        return False
 
 
 
@@ -13,6 +13,7 @@ from tqdm import tqdm
 import random
 from supabase import create_client, Client
 from pathlib import Path
+from urllib.parse import urlparse
 from datetime import datetime
 import ifcopenshell
 from pprint import pp
@@ -32,6 +33,8 @@ parser.add_argument("--num-workers", type=int, default=int(os.getenv("SLURM_CPUS
 parser.add_argument("--num-generations", type=int, default=5) 
 parser.add_argument("--num-population", type=int, default=100)
 parser.add_argument("--num-genmemory", type=int, default=0) 
+parser.add_argument("--upload", choices=["auto", "yes", "no"], default="auto",
+    help="Upload results to SUPABASE_URL. auto uploads if the host is reachable. Default is auto.")
 parser.add_argument(
     "--problemID",
     type=int,
@@ -180,6 +183,9 @@ def saveImages(listToSave, task_queue, result_queue, prefix):
 def main():
 
     args = parser.parse_args()
+    #Fail before the run instead of at the upload after it
+    if args.upload == "yes" and not (os.environ.get("SUPABASE_URL") and os.environ.get("SUPABASE_KEY")):
+        parser.error("--upload yes needs SUPABASE_URL and SUPABASE_KEY to be set")
     print(f"Using {args.num_workers} workers", flush=True)
 
     last_best = None
@@ -427,10 +433,10 @@ def main():
 
     result = saveJson(hall, os.path.splitext(os.path.basename(ifcpath))[0])
     #Upload
-    if check_internet_conn():
+    url: str = os.environ.get("SUPABASE_URL")
+    key: str = os.environ.get("SUPABASE_KEY")
+    if url and key and (args.upload == "yes" or (args.upload == "auto" and check_internet_conn(urlparse(url).hostname, 443))):
         print("Uploading results...")
-        url: str = os.environ.get("SUPABASE_URL")
-        key: str = os.environ.get("SUPABASE_KEY")
         supabase: Client = create_client(url, key)
         
         records = []
@@ -448,7 +454,7 @@ def main():
         else:
             data, count = supabase.table('highscore').insert(records).execute()
     else:
-        print("No connection to internet", flush=True)
+        print("Results not uploaded, upload disabled, SUPABASE_URL or SUPABASE_KEY not set or SUPABASE_URL not reachable", flush=True)
 
 
 
@@ -1,4 +1,5 @@
 from factorySim.factorySimEnv import FactorySimEnv#, MultiFactorySimEnv
+from factorySim.kpi import KPI_KEYS
 import ray.rllib.algorithms.ppo as ppo
 from ray.rllib.policy.policy import Policy
 import yaml
@@ -57,7 +58,7 @@ def inference():
         restored_policy = Policy.from_checkpoint(checkpointPath)["default_policy"]
 
 
-    ratingkeys = ['TotalRating', 'ratingCollision', 'ratingMF', 'ratingTrueMF', 'MFIntersection', 'routeAccess', 'pathEfficiency', 'areaUtilisation', 'Scalability', 'routeContinuity', 'routeWidthVariance', 'Deadends','terminated',]
+    ratingkeys = ['TotalRating', *KPI_KEYS, 'terminated']
     tbl = wandb.Table(columns=["image"] + ratingkeys)
 
 
@@ -15,6 +15,7 @@ from ray.rllib.algorithms.callbacks import DefaultCallbacks, MemoryTrackingCallb
 
 from ray.rllib.core.rl_module.rl_module import RLModule
 from factorySim.customRLModulTorch import MyPPOTorchRLModule
+from factorySim.kpi import KPI_KEYS
 #from factorySim.customRLModulTF import MyXceptionRLModule
 from factorySim.customModelsTorch import MyXceptionModel
 
@@ -64,7 +65,7 @@ ModelCatalog.register_custom_model("my_model", MyXceptionModel)
 class MyAlgoCallback(DefaultCallbacks):
     def __init__(self, legacy_callbacks_dict: Dict[str, Any] = None):
         #super().__init__()    
-        self.ratingkeys = ['Reward', 'TotalRating', 'ratingCollision', 'ratingMF', 'ratingTrueMF', 'MFIntersection', 'routeAccess', 'pathEfficiency', 'areaUtilisation', 'Scalability', 'routeContinuity', 'routeWidthVariance', 'Deadends',]
+        self.ratingkeys = ['Reward', 'TotalRating', *KPI_KEYS]
 
     def on_episode_start(
         self,
@@ -129,6 +130,11 @@ class MyAlgoCallback(DefaultCallbacks):
         policies: Optional[Dict[PolicyID, Policy]] = None,
         **kwargs,
     ) -> None:
+        memory = episode._last_infos['agent0'].get("memory", None)
+        if memory:
+            for key, value in memory.items():
+                if isinstance(value, (int, float)):
+                    episode.custom_metrics[f"memory_{key}"] = value
         if "Evaluation" in episode._last_infos['agent0']:
             info = episode._last_infos['agent0']
             for key in self.ratingkeys: